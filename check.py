@@ -1,8 +1,10 @@
-import json
 import os
 import re
 import logging
 
+from url_checker import UrlChecker, UrlStatusCache
+from result_io import ResultWriter, iter_results
+
 # 配置日志
 logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -11,9 +13,17 @@ logging.basicConfig(
 )
 
 # 全局参数
-INPUT_JSON_FILE = "merged_datasets.json"
+INPUT_JSON_FILE = "merged_datasets.json"      # 输入 / 输出均可为 .json 或 .jsonl（每行一篇）
 VALID_URLS_FILE = "valid_urls1.json"
 INVALID_URLS_FILE = "invalid_urls1.json"
+LIVE_CHECK = True                        # True：联网确认 URL 可达（HEAD/GET，跟随重定向）；False：只做格式检查
+CHECK_WORKERS = 64                       # 同时在途的检查请求数
+CHECK_PER_HOST = 4                       # 同一主机同时在途的请求数
+CHECK_CACHE_DB = "dataset_cache.sqlite"  # 检查结果缓存，与 run.py 的 DatasetResolver 共用同一个库
+CHECK_OK_TTL = 7 * 24 * 3600             # 可达结果的缓存有效期（秒）
+CHECK_DEAD_TTL = 24 * 3600               # 失效结果的缓存有效期（秒）；超时、5xx 等临时错误不缓存
+USE_FINAL_URL = True                     # True：有效 URL 改写为重定向后的最终地址
+CHECK_BATCH_PAPERS = 1000                # 每攒够这么多篇论文联网检查一次并写出（批内 URL 去重、并发检查）
 
 # 正则表达式匹配以 http:// 或 https:// 开头的 URL
 VALID_URL_PATTERN = re.compile(r'^https?://[\w\-\.]+.*$')
@@ -36,54 +46,82 @@ def complete_url(url: str) -> str:
     http_url = f"http:{url}"
     return http_url
 
-def process_urls_in_json(input_path: str, valid_output_path: str, invalid_output_path: str):
-    """处理 JSON 文件中的 URL，补全并分类保存。"""
-    try:
-        # 读取输入 JSON 文件
-        with open(input_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as e:
-        logging.error(f"读取输入文件 {input_path} 失败：{e}")
-        return
+def classify_paper(datasets: dict) -> tuple[dict, dict]:
+    """一篇论文的数据集按 URL 格式分为 (有效, 无效)；有效的 URL 已补全协议。"""
+    valid, invalid = {}, {}
+    for dataset, info in datasets.items():
+        url = info[1]  # URL 在列表的第二个位置
+        if url == "N/A" or not url:
+            invalid[dataset] = info
+            continue
+
+        # 补全 URL
+        completed_url = complete_url(url)
+        # 验证 URL
+        if is_valid_url(completed_url):
+            valid[dataset] = info.copy()
+            valid[dataset][1] = completed_url
+        else:
+            invalid[dataset] = info
+            logging.warning(f"无效 URL: {url} (补全后: {completed_url})")
+    return valid, invalid
 
-    valid_urls = {}
-    invalid_urls = {}
-
-    # 遍历 JSON 数据
-    for paper, datasets in data.items():
-        valid_urls[paper] = {}
-        invalid_urls[paper] = {}
-        for dataset, info in datasets.items():
-            url = info[1]  # URL 在列表的第二个位置
-            if url == "N/A" or not url:
-                invalid_urls[paper][dataset] = info
-                continue
-
-            # 补全 URL
-            completed_url = complete_url(url)
-            # 验证 URL
-            if is_valid_url(completed_url):
-                valid_urls[paper][dataset] = info.copy()
-                valid_urls[paper][dataset][1] = completed_url
+def check_batch(batch: list, checker: UrlChecker):
+    """
+    联网确认一批论文的有效 URL（就地修改）：确认失效的移入无效列表，可达的按需改写为重定向后的地址；
+    结果不确定的（超时、429、5xx 等）保留在有效列表中、URL 不变，下次运行重新检查。
+    """
+    statuses = checker.check_many(info[1] for _, valid, _ in batch for info in valid.values())
+    for _, valid, invalid in batch:
+        for dataset in list(valid):
+            info = valid[dataset]
+            status = statuses[info[1]]
+            if status.ok:
+                if USE_FINAL_URL:
+                    info[1] = status.final_url
+            elif status.ok is None:
+                logging.warning(f"URL 检查结果不确定，暂按有效保留: {info[1]} ({status.error or status.status})")
             else:
-                invalid_urls[paper][dataset] = info
-                logging.warning(f"无效 URL: {url} (补全后: {completed_url})")
+                invalid[dataset] = valid.pop(dataset)
+                logging.warning(f"不可达 URL: {info[1]} ({status.error or status.status})")
 
-    # 直接覆盖保存有效 URL
-    try:
-        with open(valid_output_path, 'w', encoding='utf-8') as f:
-            json.dump(valid_urls, f, ensure_ascii=False, indent=4)
-        logging.info(f"有效 URL 已保存至 {valid_output_path}")
-    except Exception as e:
-        logging.error(f"保存有效 URL 失败：{e}")
+def process_urls_in_json(input_path: str, valid_output_path: str, invalid_output_path: str):
+    """
+    处理结果文件（.json / .jsonl）中的 URL：补全、格式检查，LIVE_CHECK 时再联网确认可达，分类保存。
+    输入逐篇流式读取，每 CHECK_BATCH_PAPERS 篇联网检查一次并立即写出，内存占用与语料大小无关。
+    """
+    checker = cache = None
+    if LIVE_CHECK:
+        cache = UrlStatusCache(CHECK_CACHE_DB, ok_ttl=CHECK_OK_TTL, dead_ttl=CHECK_DEAD_TTL)
+        checker = UrlChecker(cache, workers=CHECK_WORKERS, per_host=CHECK_PER_HOST)
+
+    def flush(batch):
+        if checker:
+            check_batch(batch, checker)
+        for paper, valid, invalid in batch:
+            valid_writer.write(paper, valid)
+            invalid_writer.write(paper, invalid)
+        batch.clear()
 
-    # 直接覆盖保存无效 URL
+    # 两个输出都先写临时文件，全部成功后才覆盖；出错时保留原有文件
     try:
-        with open(invalid_output_path, 'w', encoding='utf-8') as f:
-            json.dump(invalid_urls, f, ensure_ascii=False, indent=4)
+        with ResultWriter(valid_output_path) as valid_writer, ResultWriter(invalid_output_path) as invalid_writer:
+            batch = []
+            for paper, datasets in iter_results(input_path):
+                batch.append((paper, *classify_paper(datasets)))
+                if len(batch) >= CHECK_BATCH_PAPERS:
+                    flush(batch)
+            flush(batch)
+        logging.info(f"有效 URL 已保存至 {valid_output_path}")
         logging.info(f"无效 URL 已保存至 {invalid_output_path}")
+    except (OSError, ValueError) as e:
+        logging.error(f"读取输入文件 {input_path} 失败，未覆盖原有输出：{e}")
     except Exception as e:
-        logging.error(f"保存无效 URL 失败：{e}")
+        logging.error(f"处理 {input_path} 失败：{e}")
+    finally:
+        if checker:
+            checker.close()
+            cache.close()
 
 def main():
     cwd = os.path.abspath(os.path.dirname(__file__))
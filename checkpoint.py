@@ -0,0 +1,84 @@
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+STAGE_EXTRACTED = "extracted"   # LLM 抽取完成，URL 尚未补全
+STAGE_DONE = "done"             # 整篇完成
+
+
+class ProgressStore:
+    """
+    逐篇论文的断点记录（追加写 JSONL，每行一条，写完即 fsync）。
+    同一论文可出现多行，以最后一行为准；崩溃时写了一半的末行在加载时丢弃。
+    给定 keys（论文名 -> PDF 指纹与配置的组合键）时每行都带上 key，
+    读取时只认 key 与当前一致的记录，PDF 或配置变化后旧断点自动失效。
+    """
+
+    def __init__(self, path: str, keys: dict[str, str] | None = None):
+        self.path = path
+        self.keys = keys
+        self._lock = threading.Lock()
+        self.entries: dict[str, dict] = {}
+        self._load()
+        self._f = open(self.path, "a", encoding="utf-8")
+        if self._f.tell() and not self._ends_with_newline():
+            self._f.write("\n")   # 上次在行中间中断：另起一行，残行加载时会被跳过
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        bad = 0
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    rec = json.loads(line)
+                    self.entries[rec["paper"]] = rec
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    bad += 1
+        if bad:
+            logger.warning("断点文件 %s 中有 %d 行无法解析，已忽略", self.path, bad)
+
+    def record(self, paper: str, datasets: dict[str, list], stage: str = STAGE_DONE):
+        rec = {"paper": paper, "stage": stage, "datasets": datasets, "ts": time.time()}
+        if self.keys is not None:
+            rec["key"] = self.keys.get(paper)
+        line = json.dumps(rec, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._f.write(line)
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self.entries[paper] = rec
+
+    def papers(self, stage: str) -> dict[str, dict[str, list]]:
+        """处于 stage 的论文及其数据集。"""
+        with self._lock:
+            return {p: rec["datasets"] for p, rec in self.entries.items()
+                    if rec["stage"] == stage and (self.keys is None or rec.get("key") == self.keys.get(p))}
+
+    def compact(self):
+        """每篇只保留最新一行，原子替换断点文件。"""
+        with self._lock:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for rec in self.entries.values():
+                    f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._f.close()
+            os.replace(tmp, self.path)
+            self._f = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        with self._lock:
+            self._f.close()
@@ -0,0 +1,124 @@
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Iterable
+
+# 括号里的内容多为别名或版本说明，如 "ImageNet (ILSVRC 2012)"
+_PAREN_PAT = re.compile(r"[\(\[（【]([^\)\]）】]*)[\)\]）】]")
+# 不区分数据集的泛称，整名只剩这些词时保留
+_GENERIC_WORDS = re.compile(r"\b(?:the|datasets?|data\s+sets?|benchmarks?|corpus|corpora)\b")
+_NON_ALNUM = re.compile(r"[^a-z0-9一-鿿]+")
+_DIGITS = re.compile(r"\d+")
+# 版本号写法统一："v2.0" / "2.0" -> "2"
+_VERSION_PAT = re.compile(r"\bv(?=\d)|(?<=\d)\.0\b(?!\.\d)")
+
+# 内置别名：规范键 -> 同一数据集的规范键
+BUILTIN_ALIASES = {
+    "imagenet1k": "imagenet",
+    "imagenet2012": "imagenet",
+    "ilsvrc": "imagenet",
+    "ilsvrc2012": "imagenet",
+    "mscoco": "coco",
+    "microsoftcoco": "coco",
+}
+
+FUZZY_THRESHOLD = 0.8      # 三元组 Jaccard 相似度达到此值才视为同名（且数字部分须一致）
+_FUZZY_MIN_CHARS = 6       # 过短的键不做模糊匹配
+
+
+def _key(s: str) -> str:
+    s = _VERSION_PAT.sub("", unicodedata.normalize("NFKC", s).lower())
+    stripped = _GENERIC_WORDS.sub(" ", s)
+    key = _NON_ALNUM.sub("", stripped)
+    return key or _NON_ALNUM.sub("", s)
+
+
+def normalize_name(name: str) -> str:
+    """数据集名的规范键：去掉括号内容、大小写、标点空白与 dataset / benchmark 等泛称。"""
+    key = _key(_PAREN_PAT.sub(" ", name or ""))
+    return key or _key(name or "")
+
+
+def name_keys(name: str) -> list[str]:
+    """名称本身的规范键，以及括号中各别名的规范键（按此顺序，去重）。"""
+    keys = [normalize_name(name)]
+    keys += [_key(inner) for inner in _PAREN_PAT.findall(name or "")]
+    return [k for k in dict.fromkeys(keys) if k]
+
+
+def _grams(key: str) -> set[str]:
+    padded = f"^{key}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class AliasIndex:
+    """
+    数据集名 -> 规范名的索引，线程安全。
+    精确查找走规范键的哈希表（含内置别名与括号别名）；查不到时用三元组倒排索引做模糊匹配，
+    只接受相似度达到 FUZZY_THRESHOLD 且数字一致的候选（CIFAR-10 与 CIFAR-100 不会合并）。
+    同一数据集以最先登记的写法作为规范名。
+    """
+
+    def __init__(self, names: Iterable[str] = (), aliases: dict[str, str] = BUILTIN_ALIASES):
+        self._alias = dict(aliases)
+        self._display: dict[str, str] = {}          # 规范键 -> 规范名
+        self._grams: dict[str, set[str]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self.update(names)
+
+    def __len__(self) -> int:
+        return len(self._display)
+
+    def _root(self, key: str) -> str:
+        return self._alias.get(key, key)
+
+    def _fuzzy(self, key: str) -> str | None:
+        if len(key) < _FUZZY_MIN_CHARS:
+            return None
+        grams = _grams(key)
+        shared: dict[str, int] = defaultdict(int)
+        for g in grams:
+            for cand in self._grams.get(g, ()):
+                shared[cand] += 1
+        digits = _DIGITS.findall(key)
+        best, best_sim = None, 0.0
+        for cand, n in shared.items():
+            sim = n / (len(grams) + len(_grams(cand)) - n)
+            if sim > best_sim and _DIGITS.findall(cand) == digits:
+                best, best_sim = cand, sim
+        return best if best_sim >= FUZZY_THRESHOLD else None
+
+    def _lookup(self, keys: list[str]) -> str | None:
+        for k in keys:
+            root = self._root(k)
+            if root in self._display:
+                return root
+        return self._fuzzy(self._root(keys[0])) if keys else None
+
+    def find(self, name: str) -> str | None:
+        """已登记的同一数据集的规范名；没有则返回 None（不登记）。"""
+        keys = name_keys(name)
+        with self._lock:
+            root = self._lookup(keys)
+            return self._display[root] if root else None
+
+    def canonical(self, name: str) -> str:
+        """name 的规范名；未登记过的名字以自身为规范名登记。"""
+        keys = name_keys(name)
+        if not keys:
+            return name.strip()
+        with self._lock:
+            root = self._lookup(keys)
+            if root is None:
+                root = self._root(keys[0])
+                self._display[root] = name.strip()
+                for g in _grams(root):
+                    self._grams[g].add(root)
+            elif self._root(keys[0]) not in self._display:
+                self._alias[keys[0]] = root     # 记住经括号别名 / 模糊匹配得到的映射
+            return self._display[root]
+
+    def update(self, names: Iterable[str]):
+        for name in names:
+            self.canonical(name)
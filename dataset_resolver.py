@@ -1,82 +1,254 @@
-import re, os, json, time, sqlite3, html, requests, urllib.parse
+import re, os, json, time, sqlite3, html, requests, urllib.parse, threading
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import closing
 import logging
+
+from metrics import get_metrics
+from dataset_names import AliasIndex
 logger = logging.getLogger(__name__)
 
 PWC_API = "https://paperswithcode.com/api/v0/datasets/{}"
 HF_API  = "https://huggingface.co/api/datasets?search={}"
 DDG_API = "https://duckduckgo.com/html/?q={}"
 
+POSITIVE_TTL = 180 * 24 * 3600   # 已解析 URL 过期后重新查询（失败则沿用旧值）
+NEGATIVE_TTL = 7 * 24 * 3600     # 所有源都查不到的名字，在此期间内不再联网
+FAN_OUT_NAMES = 8                # fan_out 时同时在查的名字数（线程池 = 名字数 × 解析源数）
+
+# DuckDuckGo 限流 / 人机验证页的特征；出现时按错误处理，不能当作“查不到”
+_DDG_BLOCKED = ("anomaly-modal", "bots use DuckDuckGo", "anomaly.js")
+_DDG_RESULT_PAGE = ('class="result', 'class="no-results', "No results.")
+
+class SourceUnavailable(Exception):
+    """解析源暂时不可用（限流、5xx、验证页等），结果记为 error，不参与负缓存判断。"""
+
+
+def _get(url: str, **kw) -> requests.Response:
+    """GET 请求；404 原样返回（按未找到处理），其余非 2xx 抛出 SourceUnavailable。"""
+    r = requests.get(url, **kw)
+    if r.status_code != 404 and not 200 <= r.status_code < 300:
+        raise SourceUnavailable(f"HTTP {r.status_code}")
+    return r
+
+
 def _slugify(s: str) -> str:
     return re.sub(r"[^a-z0-9\-]+", "", s.lower().replace(" ", "-"))
 
 class DatasetResolver:
-    def __init__(self, db: str = "dataset_cache.sqlite", verbose: bool = True):
-        self.conn = sqlite3.connect(db)
+    # 解析源，按优先级从高到低排列
+    SOURCES = (
+        ("PapersWithCode", "_from_pwc"),
+        ("HuggingFace",    "_from_hf"),
+        ("DuckDuckGo",     "_from_ddg"),
+        ("Kaggle",         "_from_kaggle"),
+        ("GoogleDS",       "_from_google_ds"),
+        ("PWC-Search",     "_from_pwc_search"),
+        ("GitHub",         "_from_github"),
+    )
+
+    def __init__(self, db: str = "dataset_cache.sqlite", verbose: bool = True,
+                 fan_out: bool = False, fan_out_workers: int | None = None,
+                 positive_ttl: float = POSITIVE_TTL, negative_ttl: float = NEGATIVE_TTL,
+                 aliases: AliasIndex | None = None):
+        """
+        fan_out=True 时并发查询所有解析源，仍按 SOURCES 优先级选取结果，
+        最坏耗时约为一次超时，而不是各源超时之和。
+        fan_out_workers 为各源请求共用的线程数，默认 FAN_OUT_NAMES × 源数；同时在查的名字数
+        限制为 fan_out_workers // 源数，保证提交的请求都能立即开始，超时不会耗在排队上。
+        positive_ttl / negative_ttl：已解析 URL 与“确认查不到”条目的有效期（秒）。
+        aliases：数据集名别名索引，默认由缓存中已解析过的名字建立；
+        同一数据集的不同写法（如 ImageNet-1K / ImageNet (ILSVRC 2012)）共用一行缓存、只联网一次。
+        """
+        # 流水线的多个 resolve worker 共用同一连接，读写都在锁内进行
+        self.conn = sqlite3.connect(db, check_same_thread=False)
+        self._lock = threading.RLock()
         self._ensure()
         self.verbose = verbose
+        self.fan_out = fan_out
+        self.positive_ttl = positive_ttl
+        self.negative_ttl = negative_ttl
+        fan_out_workers = fan_out_workers or FAN_OUT_NAMES * len(self.SOURCES)
+        self._pool = ThreadPoolExecutor(max_workers=fan_out_workers,
+                                        thread_name_prefix="resolve-src") if fan_out else None
+        self._fan_out_slots = threading.BoundedSemaphore(max(1, fan_out_workers // len(self.SOURCES)))
+        self.aliases = aliases if aliases is not None else AliasIndex(self.known_names())
 
     def _ensure(self):
         self.conn.execute(
             "CREATE TABLE IF NOT EXISTS url_cache (name TEXT PRIMARY KEY, url TEXT, ts REAL)"
         )
-
-    def _get(self, name):
-        cur = self.conn.execute("SELECT url FROM url_cache WHERE name=?", (name,))
-        row = cur.fetchone()
-        return row[0] if row else None
-
-    def _save(self, name, url):
+        # 每个名字在每个解析源上最近一次的结果：hit / miss / error
         self.conn.execute(
-            "INSERT OR REPLACE INTO url_cache(name, url, ts) VALUES(?,?,?)",
-            (name, url, time.time()),
+            "CREATE TABLE IF NOT EXISTS source_outcomes ("
+            "name TEXT, source TEXT, outcome TEXT, ts REAL, PRIMARY KEY (name, source))"
         )
         self.conn.commit()
 
+    def _get_many(self, names, batch: int = 500) -> dict[str, tuple[str | None, float]]:
+        """批量查缓存，返回 {name: (url, ts)}；url 为 None 的是负缓存条目。"""
+        rows = {}
+        with self._lock:
+            for i in range(0, len(names), batch):
+                part = names[i:i + batch]
+                cur = self.conn.execute(
+                    f"SELECT name, url, ts FROM url_cache WHERE name IN ({','.join('?' * len(part))})", part
+                )
+                rows.update((name, (url or None, ts or 0.0)) for name, url, ts in cur)
+        return rows
+
+    def _save_many(self, urls: dict[str, str | None], outcomes: dict[str, dict[str, str]]):
+        """单个事务写回解析结果（url 为 None 即负缓存）及各源的结果。"""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO url_cache(name, url, ts) VALUES(?,?,?)",
+                [(name, url, now) for name, url in urls.items()],
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO source_outcomes(name, source, outcome, ts) VALUES(?,?,?,?)",
+                [(name, source, outcome, now)
+                 for name, per_source in outcomes.items() for source, outcome in per_source.items()],
+            )
+
+    def known_names(self) -> list[str]:
+        """缓存中所有已成功解析过的数据集名。"""
+        with self._lock:
+            return [row[0] for row in self.conn.execute("SELECT name FROM url_cache WHERE url IS NOT NULL")]
+
     def resolve(self, name: str, *, no_fetch=False, **opt) -> str | None:
-        name = name.strip()
-        cached = self._get(name)
-        if cached:
-            if self.verbose:
-                print(f"[cache] {name} -> {cached}")
-            return cached
+        return self.resolve_many([name], no_fetch=no_fetch, **opt)[name]
+
+    def resolve_many(self, names, *, no_fetch=False, max_workers: int = 8, **opt) -> dict[str, str | None]:
+        """
+        批量解析：按别名索引归一并去重 → 一次批量查缓存 → 只对需要联网的名字并发查询 → 单个事务写回。
+        需要联网的是：从未查过的、正缓存超过 positive_ttl 的（刷新失败时沿用旧 URL）、
+        负缓存超过 negative_ttl 的。负缓存有效期内的名字直接返回 None，不联网。
+        返回 {传入的名字: url 或 None}。
+        """
+        keys = {name: self.aliases.canonical(name) for name in names}
+        unique = list(dict.fromkeys(keys.values()))
+        rows = self._get_many(unique)
+        now = time.time()
+
+        found, to_fetch = {}, []
+        for n in unique:
+            url, ts = rows.get(n, (None, None))
+            if ts is None:
+                to_fetch.append(n)
+            elif url:
+                found[n] = url
+                if now - ts > self.positive_ttl:
+                    to_fetch.append(n)
+                elif self.verbose:
+                    print(f"[cache] {n} -> {url}")
+            elif now - ts > self.negative_ttl:
+                to_fetch.append(n)
+            elif self.verbose:
+                print(f"[cache-negative] {n}")
+
+        if len(unique) > 1 and self.verbose:
+            print(f"[batch] {len(keys)} 个名字，去重后 {len(unique)} 个，需联网 {len(to_fetch)} 个")
         if no_fetch:
             if self.verbose:
-                print(f"[cache-miss] {name} (no_fetch=True)")
+                for n in to_fetch:
+                    if n not in found:
+                        print(f"[cache-miss] {n} (no_fetch=True)")
+            return {name: found.get(key) for name, key in keys.items()}
+
+        if len(to_fetch) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="resolve-many") as pool:
+                fetched = dict(zip(to_fetch, pool.map(lambda n: self._fetch_any(n, **opt), to_fetch)))
+        else:
+            fetched = {n: self._fetch_any(n, **opt) for n in to_fetch}
+
+        to_save, outcomes = {}, {}
+        for n, (url, per_source) in fetched.items():
+            outcomes[n] = per_source
+            if url:
+                to_save[n] = found[n] = url
+            elif n in found:
+                to_save[n] = found[n]      # 刷新失败：沿用旧 URL，重新计时
+            elif per_source and all(o == "miss" for o in per_source.values()):
+                to_save[n] = None          # 所有源都明确未找到才写负缓存，网络错误不算
+        self._save_many(to_save, outcomes)
+        return {name: found.get(key) for name, key in keys.items()}
+
+    def _fetch_any(self, name, **opt) -> tuple[str | None, dict[str, str]]:
+        """
+        联网解析一个名字，返回 (url, {源: hit/miss/error})。
+        fan_out 时返回的是等待结束时的快照：之后仍在途的低优先级请求不会再改动它。
+        """
+        outcomes: dict[str, str] = {}
+        if self.fan_out:
+            url = self._fetch_fan_out(name, outcomes, **opt)
+            return url, dict(outcomes)
+        return self._fetch(name, outcomes, **opt), outcomes
+
+    def _fetch(self, name, outcomes, **opt):
+        for label, method in self.SOURCES:
+            url = self._try(label, getattr(self, method), name, outcomes, **opt)
+            if url:
+                return url
+        return None
+
+    def _fetch_fan_out(self, name, outcomes, **opt):
+        """
+        所有源同时发起，按优先级依次等待：某个源给出结果时，
+        更低优先级中尚未开始的请求被取消，已在途的请求不再等待。
+        每个名字占一个名额，直到它的所有请求结束（含不再等待的在途请求），名额用尽时在提交前等待。
+        """
+        self._fan_out_slots.acquire()
+        remaining = [len(self.SOURCES)]
+        remaining_lock = threading.Lock()
+
+        def release(_):
+            with remaining_lock:
+                remaining[0] -= 1
+                last = not remaining[0]
+            if last:
+                self._fan_out_slots.release()
+
+        futures = [self._pool.submit(self._try, label, getattr(self, method), name, outcomes, **opt)
+                   for label, method in self.SOURCES]
+        for fut in futures:
+            fut.add_done_callback(release)
+        try:
+            for fut in futures:
+                url = fut.result()
+                if url:
+                    return url
             return None
-        url = (
-            self._try("PapersWithCode", self._from_pwc, name, **opt) or
-            self._try("HuggingFace",   self._from_hf,  name, **opt) or
-            self._try("DuckDuckGo",    self._from_ddg, name, **opt) or
-            self._try("Kaggle",        self._from_kaggle, name, **opt) or
-            self._try("GoogleDS",      self._from_google_ds, name, **opt) or
-            self._try("PWC-Search",    self._from_pwc_search, name, **opt) or
-            self._try("GitHub",        self._from_github, name, **opt)
-        )
-        if url:
-            self._save(name, url)
-        return url
+        finally:
+            for fut in futures:
+                fut.cancel()
 
-    def _try(self, label: str, fn, *a, **kw):
+    def _try(self, label: str, fn, name, outcomes: dict, **kw):
+        start = time.perf_counter()
         try:
-            url = fn(*a, **kw)
+            url = fn(name, **kw)
+            outcomes[label] = "hit" if url else "miss"
             if self.verbose:
-                print(f"[{label}] {a[0]} -> {url or 'None'}")
+                print(f"[{label}] {name} -> {url or 'None'}")
             return url
         except Exception as e:
-            logger.warning("[%s] 解析 %s 失败: %s", label, a[0], e)
+            outcomes[label] = "error"
+            logger.warning("[%s] 解析 %s 失败: %s", label, name, e)
             return None
+        finally:
+            metrics = get_metrics()
+            metrics.observe("resolver_source_seconds", time.perf_counter() - start, source=label)
+            metrics.inc("resolver_source_total", source=label, outcome=outcomes.get(label, "error"))
 
     def _from_pwc(self, name, **opt):
         slug = _slugify(name)
-        r = requests.get(PWC_API.format(slug), timeout=opt.get("timeout", 8))
+        r = _get(PWC_API.format(slug), timeout=opt.get("timeout", 8))
         if r.status_code == 200:
             return r.json().get("url")
         return None
 
     def _from_hf(self, name, **opt):
         q = urllib.parse.quote(name)
-        r = requests.get(HF_API.format(q), timeout=opt.get("timeout", 8),
+        r = _get(HF_API.format(q), timeout=opt.get("timeout", 8),
                          headers={"Accept": "application/json"})
         try:
             arr = r.json()
@@ -86,32 +258,41 @@ class DatasetResolver:
             pass
         return None
 
+    def _ddg(self, q, **opt) -> str:
+        """DuckDuckGo HTML 搜索结果页；限流、验证页或无法识别的页面抛出 SourceUnavailable。"""
+        html_txt = _get(DDG_API.format(q), timeout=opt.get("timeout", 8)).text
+        if any(mark in html_txt for mark in _DDG_BLOCKED):
+            raise SourceUnavailable("DuckDuckGo 限流 / 人机验证")
+        if not any(mark in html_txt for mark in _DDG_RESULT_PAGE):
+            raise SourceUnavailable("DuckDuckGo 返回了无法识别的页面")
+        return html_txt
+
     def _from_ddg(self, name, **opt):
         q = urllib.parse.quote_plus(f"{name} dataset")
-        html_txt = requests.get(DDG_API.format(q), timeout=opt.get("timeout", 8)).text
+        html_txt = self._ddg(q, **opt)
         m = re.search(r'nofollow" class="[^"]+" href="([^"]+)"', html_txt)
         return html.unescape(m.group(1)) if m else None
 
     def _from_kaggle(self, name, **opt):
         q = urllib.parse.quote_plus(f"{name} site:kaggle.com")
-        html_txt = requests.get(DDG_API.format(q), timeout=opt.get("timeout", 8)).text
+        html_txt = self._ddg(q, **opt)
         m = re.search(r'nofollow" class="[^"]+" href="([^"]+)"', html_txt)
         return html.unescape(m.group(1)) if m else None
 
     def _from_google_ds(self, name, **opt):
         q = urllib.parse.quote_plus(f"{name} site:datasetsearch.research.google.com")
-        html_txt = requests.get(DDG_API.format(q), timeout=opt.get("timeout", 8)).text
+        html_txt = self._ddg(q, **opt)
         m = re.search(r'nofollow" class="[^"]+" href="([^"]+)"', html_txt)
         return html.unescape(m.group(1)) if m else None
 
     def _from_pwc_search(self, name, **opt):
         q = urllib.parse.quote_plus(f"{name} site:paperswithcode.com/datasets")
-        html_txt = requests.get(DDG_API.format(q), timeout=opt.get("timeout", 8)).text
+        html_txt = self._ddg(q, **opt)
         m = re.search(r'nofollow" class="[^"]+" href="([^"]+)"', html_txt)
         return html.unescape(m.group(1)) if m else None
 
     def _from_github(self, name, **opt):
         q = urllib.parse.quote_plus(f"{name} dataset site:github.com")
-        html_txt = requests.get(DDG_API.format(q), timeout=opt.get("timeout", 8)).text
+        html_txt = self._ddg(q, **opt)
         m = re.search(r'nofollow" class="[^"]+" href="([^"]+)"', html_txt)
         return html.unescape(m.group(1)) if m else None
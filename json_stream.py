@@ -0,0 +1,104 @@
+import json
+
+
+class IncrementalEntryParser:
+    """
+    增量解析流式返回的 JSON：每喂入一段文本，就产出其中新闭合的条目。
+
+    条目指位于第 entry_depth 层对象里、值为对象的键值对，例如
+    entry_depth=1 时 {"ImageNet": {...}, ...} 中的每个数据集，
+    entry_depth=2 时 {"1": {"ImageNet": {...}}, ...} 中的每个 (段号, 数据集)。
+    第一个 "{" 之前的内容（如 ```json 围栏）会被忽略；条目本身解析失败时跳过（计入 skipped）。
+    输入已完整时调用 close() 校验整体结构。
+    """
+
+    def __init__(self, entry_depth: int = 1):
+        self.entry_depth = entry_depth
+        self._text = ""
+        self._pos = 0
+        self._stack: list[str] = []          # 当前所在的容器："{" 或 "["
+        self._keys: list[str | None] = []    # 每层对象最近的键
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: str | None = None
+        self._value_start: int | None = None
+        self._started = False
+        self._closed = False
+        self.skipped = 0
+
+    def feed(self, chunk: str) -> list[tuple[tuple[str, ...], dict]]:
+        """喂入新文本，返回 [(键路径, 条目值)]，键路径长度为 entry_depth。"""
+        self._text += chunk
+        out = []
+        text, depth = self._text, self.entry_depth
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    try:
+                        self._last_string = json.loads(text[self._string_start:i + 1])
+                    except json.JSONDecodeError:
+                        self._last_string = None
+            elif not self._started:
+                if ch == "{":
+                    self._started = True
+                    self._stack.append("{")
+                    self._keys.append(None)
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":" and self._stack and self._stack[-1] == "{":
+                self._keys[-1] = self._last_string
+            elif ch in "{[":
+                self._closed = False
+                if ch == "{" and len(self._stack) == depth and self._stack[-1] == "{":
+                    self._value_start = i
+                self._stack.append(ch)
+                self._keys.append(None)
+            elif ch in "}]" and self._stack:
+                self._stack.pop()
+                self._closed = not self._stack
+                self._keys.pop()
+                if ch == "}" and len(self._stack) == depth and self._value_start is not None:
+                    path = tuple(self._keys[:depth])
+                    try:
+                        value = json.loads(text[self._value_start:i + 1])
+                        if None not in path:
+                            out.append((path, value))
+                    except json.JSONDecodeError:
+                        self.skipped += 1
+                    self._value_start = None
+            i += 1
+        self._pos = i
+        self._compact()
+        return out
+
+    def close(self):
+        """输入结束：没有完整的顶层对象（截断、非 JSON）或有条目解析失败时抛出 ValueError。"""
+        if not self._started:
+            raise ValueError("输入中没有 JSON 对象")
+        if not self._closed or self._in_string:
+            raise ValueError(f"JSON 不完整（在第 {len(self._stack)} 层截断）")
+        if self.skipped:
+            raise ValueError(f"有 {self.skipped} 个条目无法解析")
+
+    def _compact(self):
+        """丢掉已处理完、之后不会再用到的文本，长输入时缓冲区只保留未闭合的条目。"""
+        cut = self._pos
+        if self._in_string:
+            cut = min(cut, self._string_start)
+        if self._value_start is not None:
+            cut = min(cut, self._value_start)
+        if cut:
+            self._text = self._text[cut:]
+            self._pos -= cut
+            self._string_start -= cut
+            if self._value_start is not None:
+                self._value_start -= cut
@@ -1,8 +1,22 @@
 # llm_agent.py
 import json
+import time
+import sqlite3
+import hashlib
+import threading
+import httpx
+import openai
 import requests
+from requests.adapters import HTTPAdapter
 from openai import OpenAI
 
+from rate_control import (get_rate_limiter, get_circuit_breaker, get_provider_router,
+                          error_for_status, parse_retry_after, is_retryable,
+                          LLMError, RateLimitError, TransientError, ResponseFormatError)
+from metrics import get_metrics, record_llm_call
+from json_stream import IncrementalEntryParser
+from token_counter import count_tokens
+
 # --- 付费API配置 ---
 PAID_API_KEY = "key"
 PAID_API_ENDPOINT_URL = "https://api.vveai.com/v1/chat/completions"
@@ -13,7 +27,175 @@ DEEPSEEK_API_KEY = "key"
 DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
 DEFAULT_DEEPSEEK_MODEL = "deepseek-chat"
 
-def call_paid_llm_api(prompt_text, model_name=DEFAULT_PAID_MODEL, temperature=0.2):
+# --- 提示词版本（修改 construct_*_prompt 时递增，增量模式据此判断旧结果是否可复用）---
+PROMPT_VERSION = "2"
+
+# --- HTTP连接池配置 ---
+HTTP_POOL_SIZE = 16           # 每个 provider 的 keep-alive 连接数上限（建议 ≥ 并发在途请求数）
+HTTP_CONNECT_TIMEOUT = 10
+LLM_READ_TIMEOUT = 240
+
+# --- LLM响应缓存配置 ---
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_DB = "llm_cache.sqlite"
+RESPONSE_CACHE_TTL = 30 * 24 * 3600        # 条目有效期（秒）
+RESPONSE_CACHE_MAX_ENTRIES = 200_000       # 超出后按写入时间淘汰最旧条目
+_EVICT_EVERY = 500                         # 每写入多少条做一次淘汰
+
+
+class ResponseCache:
+    """
+    LLM响应的磁盘缓存（SQLite），键为 提示词 + provider + 模型 + 温度 的哈希。
+    线程安全；带 TTL / 条目数上限淘汰与命中计数。
+    """
+
+    def __init__(self, db=RESPONSE_CACHE_DB, ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.conn = sqlite3.connect(db, check_same_thread=False)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        with self._lock:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT, ts REAL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_ts ON llm_cache(ts)")
+            self.conn.commit()
+
+    @staticmethod
+    def make_key(prompt_text, provider, model_name, temperature):
+        payload = json.dumps([provider, model_name, temperature, prompt_text], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        return self.get_first([key])[1]
+
+    def get_first(self, keys):
+        """按顺序查多个键，返回第一个有效条目 (下标, 响应)，都未命中时返回 (None, None)；只计一次命中 / 未命中。"""
+        with self._lock:
+            for i, key in enumerate(keys):
+                row = self.conn.execute("SELECT response, ts FROM llm_cache WHERE key=?", (key,)).fetchone()
+                if row and (not self.ttl or time.time() - row[1] <= self.ttl):
+                    self.hits += 1
+                    return i, row[0]
+            self.misses += 1
+            return None, None
+
+    def put(self, key, response):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache(key, response, ts) VALUES(?,?,?)",
+                (key, response, time.time()),
+            )
+            self.conn.commit()
+            self._puts += 1
+            if self._puts % _EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self):
+        if self.ttl:
+            self.conn.execute("DELETE FROM llm_cache WHERE ts < ?", (time.time() - self.ttl,))
+        if self.max_entries:
+            self.conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY ts DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        self.conn.commit()
+
+    def evict(self):
+        """立即执行一次 TTL / 条目数淘汰。"""
+        with self._lock:
+            self._evict()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_rate": self.hits / total if total else 0.0}
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _get_paid_session():
+    """付费API的共享 Session：复用 TCP/TLS 连接，连接池满时阻塞等待空闲连接。"""
+    with _clients_lock:
+        session = _clients.get("paid")
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, pool_block=True)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({
+                "Authorization": "Bearer " + PAID_API_KEY,
+                "Content-Type": "application/json",
+            })
+            _clients["paid"] = session
+        return session
+
+
+def _get_deepseek_client():
+    """DeepSeek 的共享 OpenAI 客户端（底层 httpx 连接池，线程安全）。"""
+    with _clients_lock:
+        client = _clients.get("free")
+        if client is None:
+            client = OpenAI(
+                base_url=DEEPSEEK_BASE_URL,
+                api_key=DEEPSEEK_API_KEY,
+                http_client=httpx.Client(
+                    limits=httpx.Limits(max_connections=HTTP_POOL_SIZE,
+                                        max_keepalive_connections=HTTP_POOL_SIZE),
+                    timeout=httpx.Timeout(LLM_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+                ),
+            )
+            _clients["free"] = client
+        return client
+
+
+def configure_http_pool(pool_size):
+    """调整连接池大小；已创建的客户端会被关闭，下次调用时按新大小重建。"""
+    global HTTP_POOL_SIZE
+    with _clients_lock:
+        HTTP_POOL_SIZE = pool_size
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """返回进程内共享的响应缓存；RESPONSE_CACHE_ENABLED 为 False 时返回 None。"""
+    global _response_cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache()
+        return _response_cache
+
+def _iter_sse_data(response):
+    """逐条产出 SSE 流中 data: 行的 JSON（OpenAI 兼容格式），遇到 [DONE] 结束。"""
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            yield json.loads(data)
+        except json.JSONDecodeError as e:
+            raise ResponseFormatError(f"付费API流式响应无法解析: {data[:200]}", provider="paid") from e
+
+
+def call_paid_llm_api(prompt_text, model_name=DEFAULT_PAID_MODEL, temperature=0.2, on_delta=None):
+    """on_delta 不为 None 时以流式方式请求，每收到一段文本就回调 on_delta(text)，最终仍返回完整文本。"""
     actual_model_name = model_name
     current_temperature = temperature
     if "#" in model_name:
@@ -28,62 +210,116 @@ def call_paid_llm_api(prompt_text, model_name=DEFAULT_PAID_MODEL, temperature=0.
         "model": actual_model_name,
         "temperature": current_temperature,
     }
-    headers = {
-        "Authorization": "Bearer " + PAID_API_KEY,
-        "Content-Type": "application/json",
-    }
+    stream = on_delta is not None
+    if stream:
+        params["stream"] = True
+        params["stream_options"] = {"include_usage": True}
 
     print(f"付费API调用：模型={actual_model_name}, 温度={current_temperature}")
+    start = time.perf_counter()
+    ok, usage = False, {}
     try:
-        response = requests.post(
-            PAID_API_ENDPOINT_URL,
-            headers=headers,
-            json=params,
-            stream=False,
-            timeout=240
-        )
-        response.raise_for_status()
-        res_json = response.json()
+        try:
+            response = _get_paid_session().post(
+                PAID_API_ENDPOINT_URL,
+                json=params,
+                stream=stream,
+                timeout=(HTTP_CONNECT_TIMEOUT, LLM_READ_TIMEOUT)
+            )
+        except requests.exceptions.RequestException as e:
+            print(f"错误：付费API请求失败: {e}")
+            raise TransientError(f"付费API请求失败: {e}", provider="paid") from e
+        if response.status_code >= 400:
+            print(f"错误：付费API请求失败: HTTP {response.status_code}")
+            print(f"响应内容: {response.text}")
+            raise error_for_status(response.status_code, f"付费API返回 HTTP {response.status_code}",
+                                   provider="paid", retry_after=parse_retry_after(response.headers))
+        if stream:
+            parts = []
+            try:
+                for event in _iter_sse_data(response):
+                    usage = event.get("usage") or usage
+                    for choice in event.get("choices") or []:
+                        delta = (choice.get("delta") or {}).get("content")
+                        if delta:
+                            parts.append(delta)
+                            on_delta(delta)
+            except requests.exceptions.RequestException as e:
+                print(f"错误：付费API流式响应中断: {e}")
+                raise TransientError(f"付费API流式响应中断: {e}", provider="paid") from e
+            finally:
+                response.close()
+            if not parts:
+                raise ResponseFormatError("付费API流式响应没有内容", provider="paid")
+            ok = True
+            return "".join(parts)
+        try:
+            res_json = response.json()
+        except ValueError as e:
+            print(f"错误：无法解码付费API的JSON响应。响应文本: {response.text}")
+            raise ResponseFormatError("付费API响应不是JSON", provider="paid",
+                                      status=response.status_code) from e
+        usage = res_json.get("usage") or {}
         if "choices" in res_json and res_json["choices"] and "message" in res_json["choices"][0] and "content" in \
                 res_json["choices"][0]["message"]:
             message = res_json["choices"][0]["message"]["content"]
+            ok = True
             return message
         else:
             print(f"错误：付费API响应格式意外。响应: {res_json}")
-            return None
-    except requests.exceptions.RequestException as e:
-        print(f"错误：付费API请求失败: {e}")
-        print(f"响应内容: {response.text}")
-        return None
-    except json.JSONDecodeError:
-        print(f"错误：无法解码付费API的JSON响应。响应文本: {response.text}")
-        return None
+            raise ResponseFormatError("付费API响应缺少 choices[0].message.content", provider="paid",
+                                      status=response.status_code)
+    finally:
+        record_llm_call("paid", actual_model_name, time.perf_counter() - start, ok,
+                        usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0))
 
 
-def call_free_llm_api(prompt_text, model_name=DEFAULT_DEEPSEEK_MODEL, temperature=0.0):
+def call_free_llm_api(prompt_text, model_name=DEFAULT_DEEPSEEK_MODEL, temperature=0.0, on_delta=None):
+    """on_delta 不为 None 时以流式方式请求，每收到一段文本就回调 on_delta(text)，最终仍返回完整文本。"""
+    start = time.perf_counter()
+    ok, usage = False, None
     try:
-        client = OpenAI(
-            base_url=DEEPSEEK_BASE_URL,
-            api_key=DEEPSEEK_API_KEY
-        )
+        client = _get_deepseek_client()
         print(f"DeepSeek API调用：模型={model_name}, 温度={temperature}")
+        messages = [
+            {"role": "system",
+             "content": "You are a helpful assistant specialized in extracting dataset information from research papers."},
+            {"role": "user", "content": prompt_text}
+        ]
+        if on_delta is not None:
+            parts = []
+            for chunk in client.chat.completions.create(model=model_name, messages=messages, temperature=temperature,
+                                                        stream=True, stream_options={"include_usage": True}):
+                usage = chunk.usage or usage
+                if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    on_delta(chunk.choices[0].delta.content)
+            if not parts:
+                raise ResponseFormatError("DeepSeek API流式响应没有内容", provider="free")
+            ok = True
+            return "".join(parts)
         response = client.chat.completions.create(
             model=model_name,
-            messages=[
-                {"role": "system",
-                 "content": "You are a helpful assistant specialized in extracting dataset information from research papers."},
-                {"role": "user", "content": prompt_text}
-            ],
+            messages=messages,
             temperature=temperature
         )
+        usage = response.usage
         if response.choices and response.choices[0].message and response.choices[0].message.content:
+            ok = True
             return response.choices[0].message.content
         else:
             print(f"错误：DeepSeek API响应格式意外。响应: {response}")
-            return None
-    except Exception as e:
+            raise ResponseFormatError("DeepSeek API响应缺少 message.content", provider="free")
+    except openai.APIStatusError as e:
         print(f"错误：DeepSeek API调用失败: {e}")
-        return None
+        raise error_for_status(e.status_code, f"DeepSeek API返回 HTTP {e.status_code}", provider="free",
+                               retry_after=parse_retry_after(e.response.headers)) from e
+    except openai.APIConnectionError as e:   # 含 APITimeoutError
+        print(f"错误：DeepSeek API调用失败: {e}")
+        raise TransientError(f"DeepSeek API连接失败: {e}", provider="free") from e
+    finally:
+        record_llm_call("free", model_name, time.perf_counter() - start, ok,
+                        getattr(usage, "prompt_tokens", 0) or 0, getattr(usage, "completion_tokens", 0) or 0)
 
 
 def construct_dataset_extraction_prompt(paper_text_content):
@@ -119,38 +355,227 @@ def construct_dataset_extraction_prompt(paper_text_content):
     return prompt
 
 
-def extract_datasets_from_text(paper_name, text_content, api_choice="free", **kwargs):
+def construct_batch_extraction_prompt(sections):
+    """把多个文本段打包进一个请求：说明只出现一次，各段用编号分隔，要求按段号分别返回JSON。"""
+    body = "\n".join(
+        f"---第{i}段开始---\n{text}\n---第{i}段结束---" for i, text in enumerate(sections, 1)
+    )
+    prompt = f"""
+请仔细分析以下 {len(sections)} 段研究论文文本（各段相互独立，可能来自不同论文）。您的任务是分别识别每一段中提及的所有数据集（包括没有出现url的数据集）。
+对于每个识别出的数据集，请提取以下信息：
+1.  "dataset_name": 数据集的标准名称。
+2.  "platform": 数据集托管的平台（例如："GitHub"、"Hugging Face"、"Official Website"、"Kaggle"、"Paper's Repository"等）。
+3.  "url": 指向数据集的完整官方链接。如果链接指向的是包含多个数据集的通用存储库（如某个GitHub组织），请尽可能找到最具体的数据集链接。
+4.  "description": 对数据集的简要描述（可选，如果文本中提供）。
+
+请将结果格式化为一个JSON字符串。此JSON字符串应为一个字典，顶级键是段号（"1" 到 "{len(sections)}"，每一段都必须出现）。
+每个段号对应的值是该段的数据集字典：键为数据集名称，值为包含 "platform"、"url" 和 "description" 键的字典。
+只根据该段自身的文本填写，不要把其他段的数据集放进来。例如：
+{{
+  "1": {{
+    "AwesomeDataset": {{
+      "platform": "GitHub",
+      "url": "https://github.com/user/awesomedataset",
+      "description": "一个用于完成出色任务的数据集。"
+    }}
+  }},
+  "2": {{}}
+}}
+
+如果某一段没有找到任何数据集，该段号对应的值为空对象 {{}}。
+
+以下是各段文本：
+{body}
+
+请确保您的回复严格遵循所请求的JSON格式。
+"""
+    return prompt
+
+
+def _select_api(api_choice, kwargs):
+    """按 api_choice 返回 (模型名, 温度, 调用函数)；无效选择返回 None。"""
+    if api_choice == "paid":
+        model_name = kwargs.get("paid_model_name", DEFAULT_PAID_MODEL)
+        temperature = kwargs.get("paid_temperature", 0.2)
+        return model_name, temperature, call_paid_llm_api
+    elif api_choice == "free":  # 现在 "free" 选项会调用 call_free_llm_api，该函数已配置为使用DeepSeek
+        model_name = kwargs.get("free_model_name", DEFAULT_DEEPSEEK_MODEL)  # 默认使用DeepSeek模型
+        temperature = kwargs.get("free_temperature", 0.0)
+        return model_name, temperature, call_free_llm_api
+    print(f"错误：无效的API选择 '{api_choice}'。请选择 'paid'、'free' 或 'auto'。")
+    return None
+
+
+def _call_provider(provider, prompt, model_name, temperature, call_api, on_delta=None):
+    """经过熔断器与限速器调用一个 provider，并把结果反馈给限速器、熔断器与路由器。"""
+    limiter, breaker = get_rate_limiter(provider), get_circuit_breaker(provider)
+    breaker.before_call()
+    limiter.acquire(count_tokens(prompt))  # 只有真正发请求才占用限额
+    start = time.perf_counter()
+    try:
+        if on_delta is None:
+            llm_response_str = call_api(prompt, model_name=model_name, temperature=temperature)
+        else:
+            llm_response_str = call_api(prompt, model_name=model_name, temperature=temperature, on_delta=on_delta)
+    except Exception as e:
+        get_metrics().inc("llm_errors_total", provider=provider, kind=type(e).__name__)
+        if isinstance(e, RateLimitError):
+            limiter.on_rate_limited(e.retry_after)
+        if is_retryable(e):
+            get_provider_router().penalize(provider)
+        # 429 与不可重试的 4xx 说明服务本身可用，不计入熔断
+        if isinstance(e, RateLimitError) or (isinstance(e, LLMError) and not e.retryable):
+            breaker.on_success()
+        else:
+            breaker.on_failure()
+        raise
+    get_provider_router().observe(provider, time.perf_counter() - start)
+    limiter.on_success()
+    breaker.on_success()
+    return llm_response_str
+
+
+def _query_llm(label, prompt, api_choice, kwargs, make_on_delta=None):
+    """
+    先查响应缓存，未命中再经过熔断器与限速器调用API。
+    api_choice="auto" 时由 rate_control 的路由器按权重与延迟排定 provider 顺序，
+    前一个失败（含熔断、限流）时自动切换到下一个。
+    给定 make_on_delta 时流式请求：每次尝试一个 provider 前调用它取得新的 on_delta 回调
+    （故障转移后新 provider 的输出从头开始）；命中缓存时不回调。
+    返回 (响应文本或None, 写缓存的回调)；回调只应在响应解析成功后调用。
+    所有 provider 都失败时抛出最后一个 rate_control.LLMError。
+    """
+    providers = get_provider_router().order() if api_choice == "auto" else [api_choice]
+    candidates = []
+    for provider in providers:
+        selected = _select_api(provider, kwargs)
+        if selected is not None:
+            candidates.append((provider, *selected))
+    if not candidates:
+        return None, lambda: None
+
+    cache = get_response_cache() if kwargs.get("use_cache", True) else None
+    keys = {provider: ResponseCache.make_key(prompt, provider, model_name, temperature)
+            for provider, model_name, temperature, _ in candidates}
+    hit, llm_response_str = cache.get_first([keys[c[0]] for c in candidates]) if cache else (None, None)
+    if llm_response_str is not None:
+        provider = candidates[hit][0]
+        print(f"\n论文 '{label}' 命中LLM响应缓存（{provider}）。")
+        get_metrics().inc("llm_cache_hits_total", provider=provider)
+        get_metrics().inc_paper("paper_llm_cache_hits_total", provider=provider)
+        return llm_response_str, lambda: None
+
+    for i, (provider, model_name, temperature, call_api) in enumerate(candidates):
+        print(f"\n正在为论文 '{label}' 查询LLM ({provider} API)...")
+        try:
+            llm_response_str = _call_provider(provider, prompt, model_name, temperature, call_api,
+                                              make_on_delta() if make_on_delta else None)
+        except Exception as e:
+            if i == len(candidates) - 1:
+                raise
+            print(f"警告：{provider} 调用失败（{type(e).__name__}），论文 '{label}' 改由 {candidates[i + 1][0]} 处理。")
+            get_metrics().inc("llm_failovers_total", source=provider, target=candidates[i + 1][0])
+            continue
+        if api_choice == "auto":
+            print(f"论文 '{label}' 由 {provider} 完成。")
+        get_metrics().inc("llm_served_total", provider=provider)
+        get_metrics().inc_paper("paper_llm_served_total", provider=provider)
+
+        def remember(key=keys[provider], response=llm_response_str):
+            if cache and response:
+                cache.put(key, response)
+        return llm_response_str, remember
+
+
+def _load_json_response(llm_response_str):
+    if llm_response_str.strip().startswith("```json"):
+        llm_response_str = llm_response_str.strip()[7:]
+        if llm_response_str.strip().endswith("```"):
+            llm_response_str = llm_response_str.strip()[:-3]
+    return json.loads(llm_response_str.strip())
+
+
+def _format_entry(ds_info):
+    platform = ds_info.get("platform", "N/A")
+    url = ds_info.get("url", "N/A")
+    description = ds_info.get("description", "")  # 默认为空字符串
+    return [platform, url, description]
+
+
+def _format_datasets(paper_name, parsed_llm_output):
+    """{名称: {platform, url, description}} -> {名称: [platform, url, description]}"""
+    formatted_datasets = {}
+    for ds_name, ds_info in parsed_llm_output.items():
+        if isinstance(ds_info, dict):
+            formatted_datasets[ds_name] = _format_entry(ds_info)
+        else:
+            print(f"警告：论文 '{paper_name}' 的数据集 '{ds_name}' 的LLM输出格式不正确：{ds_info}")
+    return formatted_datasets
+
+
+class _EntryStream:
+    """
+    把流式响应增量解析成条目，回调 on_entry(*键路径, [platform, url, description])，
+    同一条目只回调一次（包括故障转移后重新生成的输出与最终完整解析时补发的条目）。
+    """
+
+    def __init__(self, on_entry, depth, api_choice, path_fn=None):
+        self.on_entry = on_entry
+        self.depth = depth
+        self.api_choice = api_choice
+        self.path_fn = path_fn or (lambda path: path)
+        self.emitted = set()
+        self.start = time.perf_counter()
+
+    def make_on_delta(self):
+        parser = IncrementalEntryParser(self.depth)
+
+        def on_delta(text):
+            for path, ds_info in parser.feed(text):
+                self.emit(path, _format_entry(ds_info))
+        return on_delta
+
+    def emit(self, path, entry):
+        path = self.path_fn(path)
+        if path is None or path in self.emitted:
+            return
+        if not self.emitted:
+            get_metrics().observe("llm_time_to_first_entry_seconds", time.perf_counter() - self.start,
+                                  api=self.api_choice)
+        self.emitted.add(path)
+        try:
+            self.on_entry(*path, entry)
+        except Exception as e:
+            print(f"警告：条目回调失败 {path}: {e}")
+
+
+def extract_datasets_from_text(paper_name, text_content, api_choice="free", on_entry=None, **kwargs):
     """
     使用LLM从给定的文本内容中提取数据集信息。
 
     Args:
         paper_name (str): 论文的名称（用于日志记录）。
         text_content (str): 从PDF中提取的文本。
-        api_choice (str): "paid" 或 "free"，选择要使用的API。
-                          当为 "free" 时，现在将调用配置为DeepSeek的API。
+        api_choice (str): "paid"、"free" 或 "auto"，选择要使用的API。
+                          当为 "free" 时，现在将调用配置为DeepSeek的API；
+                          "auto" 时按权重与延迟在两者间路由，失败时自动切换。
+        on_entry (callable): 可选。给定时以流式方式请求，每个数据集条目一闭合就回调
+                             on_entry(dataset_name, [platform, url, description])，不必等整个响应结束。
         **kwargs: 传递给特定API函数的附加参数 (例如 model_name, temperature)。
+                  use_cache=False 可跳过响应缓存。
 
     Returns:
         dict: 一个字典，其中键是数据集名称，值是包含平台、URL和描述的列表。
               例如：{ "DatasetName": ["platform", "url", "description"] }
-              如果未找到数据集或发生错误，则返回空字典。
+              如果未找到数据集或响应无法解析，则返回空字典。
+
+    Raises:
+        rate_control.LLMError: API调用失败（限流、服务端错误、网络错误、熔断等），由调用方决定是否重试。
     """
     prompt = construct_dataset_extraction_prompt(text_content)
-    llm_response_str = None
-
-    print(f"\n正在为论文 '{paper_name}' 查询LLM ({api_choice} API)...")
-
-    if api_choice == "paid":
-        model_name = kwargs.get("paid_model_name", DEFAULT_PAID_MODEL)
-        temperature = kwargs.get("paid_temperature", 0.2)
-        llm_response_str = call_paid_llm_api(prompt, model_name=model_name, temperature=temperature)
-    elif api_choice == "free":  # 现在 "free" 选项会调用 call_free_llm_api，该函数已配置为使用DeepSeek
-        model_name = kwargs.get("free_model_name", DEFAULT_DEEPSEEK_MODEL)  # 默认使用DeepSeek模型
-        temperature = kwargs.get("free_temperature", 0.0)
-        llm_response_str = call_free_llm_api(prompt, model_name=model_name, temperature=temperature)
-    else:
-        print(f"错误：无效的API选择 '{api_choice}'。请选择 'paid' 或 'free'。")
-        return {}
+    stream = _EntryStream(on_entry, 1, api_choice) if on_entry else None
+    llm_response_str, remember = _query_llm(paper_name, prompt, api_choice, kwargs,
+                                            stream.make_on_delta if stream else None)
 
     if not llm_response_str:
         print(f"未能从LLM获取论文 '{paper_name}' 的响应。")
@@ -159,24 +584,14 @@ def extract_datasets_from_text(paper_name, text_content, api_choice="free", **kw
     print(f"LLM原始响应片段 ({paper_name}):\n{llm_response_str[:500]}...")
 
     try:
-        if llm_response_str.strip().startswith("```json"):
-            llm_response_str = llm_response_str.strip()[7:]
-            if llm_response_str.strip().endswith("```"):
-                llm_response_str = llm_response_str.strip()[:-3]
+        parsed_llm_output = _load_json_response(llm_response_str)
 
-        parsed_llm_output = json.loads(llm_response_str.strip())
-
-        formatted_datasets = {}
         if isinstance(parsed_llm_output, dict):
-            for ds_name, ds_info in parsed_llm_output.items():
-                if isinstance(ds_info, dict):
-                    platform = ds_info.get("platform", "N/A")
-                    url = ds_info.get("url", "N/A")
-                    description = ds_info.get("description", "")  # 默认为空字符串
-                    formatted_datasets[ds_name] = [platform, url, description]
-                else:
-                    print(f"警告：论文 '{paper_name}' 的数据集 '{ds_name}' 的LLM输出格式不正确：{ds_info}")
-
+            formatted_datasets = _format_datasets(paper_name, parsed_llm_output)
+            remember()
+            if stream:   # 命中缓存或流式解析漏掉的条目在此补发
+                for ds_name, entry in formatted_datasets.items():
+                    stream.emit((ds_name,), entry)
             if formatted_datasets:
                 print(f"成功为论文 '{paper_name}' 解析了 {len(formatted_datasets)} 个数据集。")
             else:
@@ -195,6 +610,75 @@ def extract_datasets_from_text(paper_name, text_content, api_choice="free", **kw
         return {}
 
 
+def _section_index(key, n):
+    """段号键（"1"、"第1段" 等）-> 0 起的下标；无效时返回 None。"""
+    try:
+        idx = int(str(key).strip().lstrip("第").rstrip("段")) - 1
+    except ValueError:
+        return None
+    return idx if 0 <= idx < n else None
+
+
+def extract_datasets_from_batch(batch_name, sections, api_choice="free", on_entry=None, **kwargs):
+    """
+    一次请求抽取多个文本段的数据集，并按段拆回各自的结果。
+
+    Args:
+        batch_name (str): 批次名称（用于日志记录）。
+        sections (list[str]): 各段文本，顺序即段号 1..n。
+        api_choice (str): 同 extract_datasets_from_text。
+        on_entry (callable): 可选，流式回调 on_entry(段下标（0 起）, dataset_name, [platform, url, description])。
+        **kwargs: 同 extract_datasets_from_text。
+
+    Returns:
+        list[dict] | None: 与 sections 等长的列表，每项格式同 extract_datasets_from_text 的返回值；
+                           响应无法按段拆分时返回 None，由调用方改为逐段抽取。
+
+    Raises:
+        rate_control.LLMError: 同 extract_datasets_from_text。
+    """
+    if len(sections) == 1:
+        single = (lambda name, entry: on_entry(0, name, entry)) if on_entry else None
+        return [extract_datasets_from_text(batch_name, sections[0], api_choice, on_entry=single, **kwargs)]
+
+    prompt = construct_batch_extraction_prompt(sections)
+    stream = None
+    if on_entry:
+        def to_index(path):
+            idx = _section_index(path[0], len(sections))
+            return None if idx is None else (idx, path[1])
+        stream = _EntryStream(on_entry, 2, api_choice, to_index)
+    llm_response_str, remember = _query_llm(batch_name, prompt, api_choice, kwargs,
+                                            stream.make_on_delta if stream else None)
+    if not llm_response_str:
+        print(f"未能从LLM获取批次 '{batch_name}' 的响应。")
+        return None
+
+    try:
+        parsed_llm_output = _load_json_response(llm_response_str)
+    except json.JSONDecodeError as e:
+        print(f"错误：无法解码来自LLM的JSON响应 ({batch_name})。错误: {e}")
+        return None
+
+    if not isinstance(parsed_llm_output, dict):
+        print(f"错误：LLM为批次 '{batch_name}' 返回的不是预期的字典格式。")
+        return None
+    by_section = {_section_index(k, len(sections)): v for k, v in parsed_llm_output.items()}
+    expected = list(range(len(sections)))
+    if set(by_section) != set(expected) or not all(isinstance(v, dict) for v in by_section.values()):
+        print(f"错误：批次 '{batch_name}' 的响应无法按段拆分，段号为 {list(parsed_llm_output)}。")
+        return None
+
+    remember()
+    results = [_format_datasets(f"{batch_name} – 第{i + 1}段", by_section[i]) for i in expected]
+    if stream:
+        for i, formatted in enumerate(results):
+            for ds_name, entry in formatted.items():
+                stream.emit((str(i + 1), ds_name), entry)
+    print(f"成功为批次 '{batch_name}' 的 {len(sections)} 段解析了 {sum(map(len, results))} 个数据集。")
+    return results
+
+
 if __name__ == '__main__':
     sample_text_content = """
     在这项工作中，我们介绍了CodeSearchNet数据集，这是一个用于代码搜索的大规模数据集。
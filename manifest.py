@@ -0,0 +1,69 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+from text_cache import file_sha256
+
+logger = logging.getLogger(__name__)
+
+
+def config_hash(config: dict) -> str:
+    payload = json.dumps(config, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+class RunManifest:
+    """
+    上次运行的清单（JSON）：每篇论文的 PDF 指纹（size / mtime / sha256）与
+    产出结果时的流水线配置哈希。两者都未变的论文在增量模式下直接复用旧结果。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.config: dict = {}
+        self.papers: dict[str, dict] = {}
+        self._stats: dict[str, tuple[int, float]] = {}   # 本次计算指纹时的 (size, mtime)
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+                self.config = data.get("config", {})
+                self.papers = data.get("papers", {})
+            except (OSError, json.JSONDecodeError) as e:
+                logger.warning("清单文件 %s 无法读取，按首次运行处理：%s", path, e)
+
+    def fingerprints(self, pdf_files: dict[str, str]) -> dict[str, str]:
+        """{论文名: PDF 路径} -> {论文名: sha256}；size 与 mtime 都未变时沿用清单中的哈希。"""
+        out = {}
+        for paper, pdf_path in pdf_files.items():
+            st = os.stat(pdf_path)
+            self._stats[paper] = (st.st_size, st.st_mtime)
+            old = self.papers.get(paper)
+            if old and old.get("size") == st.st_size and old.get("mtime") == st.st_mtime:
+                out[paper] = old["sha256"]
+            else:
+                out[paper] = file_sha256(pdf_path)
+        return out
+
+    def key(self, paper: str) -> str | None:
+        """上次产出该论文结果时的 指纹:配置哈希。"""
+        entry = self.papers.get(paper)
+        return entry.get("key") if entry else None
+
+    def save(self, config: dict, fingerprints: dict[str, str], keys: dict[str, str], completed):
+        """
+        只登记 completed 中的论文（size / mtime 取计算指纹时的值）；先写临时文件再原子替换。
+        completed 应只含抽取完整的论文，否则增量模式会一直沿用其不完整的结果。
+        """
+        papers = {}
+        for paper in completed:
+            size, mtime = self._stats[paper]
+            papers[paper] = {"size": size, "mtime": mtime,
+                             "sha256": fingerprints[paper], "key": keys[paper]}
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"config": config, "ts": time.time(), "papers": papers}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self.path)
+        self.config, self.papers = config, papers
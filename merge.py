@@ -1,7 +1,10 @@
-import json
 import os
-import re
 import logging
+from collections import Counter
+from typing import Iterable
+
+from dataset_names import AliasIndex
+from result_io import ResultWriter, is_jsonl, iter_results, index_jsonl, read_jsonl_at
 
 # 配置日志
 logging.basicConfig(
@@ -13,78 +16,179 @@ logging.basicConfig(
 # 全局参数
 ORIGINAL_JSON_FILE = "valid_urls.json"
 NEW_JSON_FILE = "deepseek.json"
-MERGED_JSON_FILE = "merged_datasets.json"
+INPUT_JSON_FILES = [ORIGINAL_JSON_FILE, NEW_JSON_FILE]   # 按优先级从高到低，可列任意多个结果文件（.json / .jsonl）
+MERGED_JSON_FILE = "merged_datasets.json"                # 以 .jsonl 结尾时每行一篇
+# 同一论文中同一数据集在多个文件里都出现时的处理方式：
+#   first —— 保留最先出现的条目（原有行为）
+#   last  —— 以最后出现的条目为准
+#   fill  —— 以最先出现的为准，缺失的字段（如 URL 为 N/A）用后面文件的补上
+#   vote  —— 同 fill，但 URL 取各文件中出现次数最多的（票数相同取先出现的）
+CONFLICT_POLICY = "first"
+
+CONFLICT_POLICIES = ("first", "last", "fill", "vote")
+_MISSING = ("", "N/A", "null", None, "Not specified", "URL redacted")
 
 def match_dataset_name(dataset_name: str, new_datasets: dict) -> str:
-    """根据数据集名称的第一部分匹配新文件中的数据集名称。"""
-    # 提取数据集名称的第一部分（以 _ 分割）
-    name_prefix = dataset_name.split('_')[0]
-    for new_name in new_datasets:
-        if new_name.startswith(name_prefix):
-            return new_name
-    return None
-
-def merge_datasets(original_data: dict, new_data: dict) -> dict:
-    """将新 JSON 文件中的数据集合并到原始 JSON 文件中。"""
-    merged_data = original_data.copy()
-    
-    for paper, datasets in new_data.items():
-        if paper not in merged_data:
-            merged_data[paper] = {}
-        
+    """在新文件的数据集中找与 dataset_name 为同一数据集的名称（按规范名与别名匹配）。"""
+    return AliasIndex(new_datasets).find(dataset_name)
+
+class DatasetMerger:
+    """
+    多个结果文件的合并：每篇论文维护一个数据集名的别名索引，
+    新条目按规范名 O(1) 查找是否已存在，整体耗时与条目总数成线性。
+    输入条目会被复制后再写入结果，不修改调用方的数据。
+    """
+
+    def __init__(self, policy: str = CONFLICT_POLICY):
+        if policy not in CONFLICT_POLICIES:
+            raise ValueError(f"未知的冲突处理方式：{policy}（可选 {', '.join(CONFLICT_POLICIES)}）")
+        self.policy = policy
+        self.result: dict[str, dict[str, list]] = {}
+        self._index: dict[str, AliasIndex] = {}
+        self._votes: dict[tuple[str, str], Counter] = {}
+        self.stats = Counter()
+
+    def add(self, paper: str, datasets: dict):
+        merged = self.result.setdefault(paper, {})
+        index = self._index.setdefault(paper, AliasIndex())
         for dataset_name, info in datasets.items():
-            # 检查原始数据中是否已有该数据集（通过名称前缀匹配）
-            matched = False
-            for orig_dataset in merged_data.get(paper, {}):
-                if match_dataset_name(orig_dataset, {dataset_name: info}):
-                    matched = True
-                    break
-            # 如果原始数据中不存在该数据集，添加
-            if not matched:
-                merged_data[paper][dataset_name] = info
-    
-    return merged_data
+            info = list(info) if isinstance(info, (list, tuple)) else [info]
+            self.stats["entries"] += 1
+            name = index.find(dataset_name)
+            if name is None:
+                name = index.canonical(dataset_name)
+                merged[name] = info
+                self._vote(paper, name, info)
+                continue
+            self.stats["duplicates"] += 1
+            self._resolve(merged[name], info)
+            self._vote(paper, name, info)
 
-def main():
-    cwd = os.path.abspath(os.path.dirname(__file__))
-    original_path = os.path.join(cwd, ORIGINAL_JSON_FILE)
-    new_path = os.path.join(cwd, NEW_JSON_FILE)
-    merged_output_path = os.path.join(cwd, MERGED_JSON_FILE)
+    def add_source(self, papers: Iterable[tuple[str, dict]]):
+        for paper, datasets in papers:
+            self.add(paper, datasets)
+        self.stats["sources"] += 1
 
-    # 检查输入文件是否存在
-    if not os.path.exists(original_path):
-        logging.error(f"原始文件 {original_path} 不存在")
-        return
-    if not os.path.exists(new_path):
-        logging.error(f"新文件 {new_path} 不存在")
-        return
+    def _resolve(self, current: list, new: list):
+        """同一数据集的两个条目冲突时，按 policy 就地更新 current。"""
+        if self.policy == "first":
+            return
+        if self.policy == "last":
+            if current != new:
+                self.stats["replaced"] += 1
+            current[:] = new
+            return
+        for i, value in enumerate(new):       # fill / vote：只补缺失字段
+            if i >= len(current):
+                current.append(value)
+            elif current[i] in _MISSING and value not in _MISSING:
+                current[i] = value
+                self.stats["filled"] += 1
 
-    # 读取原始 JSON 文件
-    try:
-        with open(original_path, 'r', encoding='utf-8') as f:
-            original_data = json.load(f)
-    except Exception as e:
-        logging.error(f"读取原始文件 {original_path} 失败：{e}")
-        return
+    def _vote(self, paper: str, name: str, info: list):
+        if self.policy == "vote" and len(info) > 1 and info[1] not in _MISSING:
+            self._votes.setdefault((paper, name), Counter())[info[1]] += 1
+
+    def _apply_votes(self, paper: str, name: str, votes: Counter):
+        url, _ = votes.most_common(1)[0]
+        entry = self.result[paper][name]
+        if entry[1] != url:
+            entry[1] = url
+            self.stats["voted"] += 1
 
-    # 读取新 JSON 文件
+    def pop(self, paper: str) -> dict[str, list]:
+        """取出一篇已合并完的论文并释放其索引（逐篇流式合并时使用）。"""
+        for name in list(self.result.get(paper, ())):
+            votes = self._votes.pop((paper, name), None)
+            if votes:
+                self._apply_votes(paper, name, votes)
+        self._index.pop(paper, None)
+        return self.result.pop(paper, {})
+
+    def finish(self) -> dict[str, dict[str, list]]:
+        for (paper, name), votes in self._votes.items():
+            self._apply_votes(paper, name, votes)
+        self._votes.clear()
+        return self.result
+
+def merge_datasets(*sources: dict, policy: str = CONFLICT_POLICY) -> dict:
+    """合并任意多份结果（按优先级从高到低），返回新的字典，不修改输入。"""
+    merger = DatasetMerger(policy)
+    for data in sources:
+        merger.add_source(data.items())
+    return merger.finish()
+
+def _merge_jsonl_files(merger: DatasetMerger, paths: list[str], writer: ResultWriter):
+    """
+    全部输入都是 .jsonl 时逐篇合并：先给每个文件建 论文 -> 行偏移 的索引，
+    再按论文依次从各文件读出该篇、合并后立即写出。内存中只有偏移索引与当前一篇。
+    """
+    indexes = [index_jsonl(path) for path in paths]
+    files = [open(path, "rb") for path in paths]
     try:
-        with open(new_path, 'r', encoding='utf-8') as f:
-            new_data = json.load(f)
-    except Exception as e:
-        logging.error(f"读取新文件 {new_path} 失败：{e}")
-        return
+        for paper in dict.fromkeys(p for index in indexes for p in index):
+            for f, index in zip(files, indexes):
+                for offset in index.get(paper, ()):
+                    merger.add(*read_jsonl_at(f, offset))
+            writer.write(paper, merger.pop(paper))
+        merger.stats["sources"] += len(paths)
+    finally:
+        for f in files:
+            f.close()
+
+def merge_files(paths: Iterable[str], output_path: str, policy: str = CONFLICT_POLICY) -> DatasetMerger:
+    """
+    流式读取并合并多个结果文件，写出到 output_path；不存在的文件跳过。
+    任一文件读取失败（含截断、损坏）时抛出 ValueError，且不写出 / 覆盖 output_path。
+    输入全是 .jsonl 时逐篇合并、内存占用与语料大小无关；否则合并结果留在内存中，最后逐篇写出。
+    """
+    merger = DatasetMerger(policy)
+    existing = []
+    for path in paths:
+        if os.path.exists(path):
+            existing.append(path)
+        else:
+            logging.error(f"输入文件 {path} 不存在，已跳过")
+    if not existing:
+        return merger
 
-    # 合并数据集
-    merged_data = merge_datasets(original_data, new_data)
+    with ResultWriter(output_path) as writer:
+        if all(is_jsonl(path) for path in existing):
+            try:
+                _merge_jsonl_files(merger, existing, writer)
+            except (OSError, ValueError) as e:
+                raise ValueError(f"读取输入文件失败：{e}") from e
+            return merger
+        for path in existing:
+            try:
+                merger.add_source(iter_results(path))
+            except (OSError, ValueError) as e:
+                raise ValueError(f"读取文件 {path} 失败：{e}") from e
+        writer.write_all(merger.finish().items())
+    return merger
 
-    # 保存合并后的数据
+def main():
+    cwd = os.path.abspath(os.path.dirname(__file__))
+    input_paths = [os.path.join(cwd, name) for name in INPUT_JSON_FILES]
+    merged_output_path = os.path.join(cwd, MERGED_JSON_FILE)
+
+    # 合并并逐篇写出
     try:
-        with open(merged_output_path, 'w', encoding='utf-8') as f:
-            json.dump(merged_data, f, ensure_ascii=False, indent=4)
-        logging.info(f"合并数据集已保存至 {merged_output_path}")
+        merger = merge_files(input_paths, merged_output_path, CONFLICT_POLICY)
+    except ValueError as e:
+        logging.error(e)
+        return
     except Exception as e:
         logging.error(f"保存合并数据集失败：{e}")
+        return
+    if not merger.stats["sources"]:
+        logging.error("没有可合并的输入文件")
+        return
+    stats = merger.stats
+    logging.info(f"合并 {stats['sources']} 个文件：{stats['entries']} 个条目，其中重复 {stats['duplicates']} 个"
+                 f"（策略 {CONFLICT_POLICY}：替换 {stats['replaced']}，补全字段 {stats['filled']}，"
+                 f"按票数改 URL {stats['voted']}）")
+    logging.info(f"合并数据集已保存至 {merged_output_path}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
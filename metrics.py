@@ -0,0 +1,219 @@
+import csv
+import json
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# 延迟类直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160, 320)
+
+# 每百万 token 的价格（美元）：(输入, 输出)；未列出的模型不计费用
+MODEL_PRICING = {
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "deepseek-chat": (0.27, 1.10),
+}
+
+# 当前线程 / 上下文正在处理的论文及其权重，例如 {"paperA": 0.7, "paperB": 0.3}
+_paper_scope: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar("paper_scope", default=None)
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Histogram:
+    """固定桶直方图：记录各桶计数、总和、最小 / 最大值，分位数按桶线性插值估计。"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # 最后一格是 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = self.buckets[i - 1] if i > 0 else min(self.min, self.buckets[0])
+                hi = self.buckets[i] if i < len(self.buckets) else self.max
+                lo, hi = max(lo, self.min), min(hi, self.max)
+                return lo + (hi - lo) * (rank - seen) / n
+            seen += n
+        return self.max
+
+    def to_dict(self) -> dict:
+        cumulative, acc = {}, 0
+        for le, n in zip(list(self.buckets) + ["+Inf"], self.counts):
+            acc += n
+            cumulative[str(le)] = acc
+        return {"count": self.count, "sum": self.sum, "min": self.min, "max": self.max,
+                "mean": self.sum / self.count if self.count else None,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95), "buckets": cumulative}
+
+
+class MetricsRegistry:
+    """
+    进程内指标登记：带标签的计数器与直方图，线程安全。
+    run 结束后可导出 JSON / CSV 报告与 Prometheus 文本格式。
+    """
+
+    def __init__(self):
+        self._counters: dict[tuple, float] = {}
+        self._histograms: dict[tuple, Histogram] = {}
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(buckets)
+            hist.observe(value)
+
+    def inc_paper(self, name: str, value: float = 1, **labels):
+        """按当前 paper_scope 把 value 分摊到各论文（批量请求跨论文时按权重分摊）。"""
+        for paper, weight in (_paper_scope.get() or {}).items():
+            self.inc(name, value * weight, paper=paper, **labels)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started = time.time()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = [{"name": n, "labels": dict(lb), "value": v}
+                        for (n, lb), v in sorted(self._counters.items())]
+            histograms = [{"name": n, "labels": dict(lb), **h.to_dict()}
+                          for (n, lb), h in sorted(self._histograms.items())]
+        by_paper: dict[str, dict[str, float]] = {}
+        for c in counters:
+            paper = c["labels"].get("paper")
+            if paper is not None:
+                rest = ",".join(f"{k}={v}" for k, v in c["labels"].items() if k != "paper")
+                metric = f"{c['name']}{{{rest}}}" if rest else c["name"]
+                row = by_paper.setdefault(paper, {})
+                row[metric] = row.get(metric, 0) + c["value"]
+        return {"started": self.started, "finished": time.time(),
+                "counters": counters, "histograms": histograms, "by_paper": by_paper}
+
+    def write_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=4)
+
+    def write_csv(self, path: str):
+        """每行一个指标序列：计数器填 value，直方图填 count/sum/min/max/mean/p50/p95。"""
+        snap = self.snapshot()
+        fields = ["type", "name", "labels", "value", "count", "sum", "min", "max", "mean", "p50", "p95"]
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            w = csv.DictWriter(f, fieldnames=fields)
+            w.writeheader()
+            for c in snap["counters"]:
+                w.writerow({"type": "counter", "name": c["name"],
+                            "labels": _format_labels(c["labels"]), "value": c["value"]})
+            for h in snap["histograms"]:
+                w.writerow({"type": "histogram", "labels": _format_labels(h["labels"]),
+                            **{k: h[k] for k in fields if k in h and k != "labels"}})
+
+    def write_prometheus(self, path: str):
+        """Prometheus 文本暴露格式，可交给 node_exporter 的 textfile collector。"""
+        snap = self.snapshot()
+        lines, typed = [], set()
+        for c in snap["counters"]:
+            if c["name"] not in typed:
+                lines.append(f"# TYPE {c['name']} counter")
+                typed.add(c["name"])
+            lines.append(f"{c['name']}{_prom_labels(c['labels'])} {c['value']}")
+        for h in snap["histograms"]:
+            if h["name"] not in typed:
+                lines.append(f"# TYPE {h['name']} histogram")
+                typed.add(h["name"])
+            for le, n in h["buckets"].items():
+                lines.append(f"{h['name']}_bucket{_prom_labels({**h['labels'], 'le': le})} {n}")
+            lines.append(f"{h['name']}_sum{_prom_labels(h['labels'])} {h['sum']}")
+            lines.append(f"{h['name']}_count{_prom_labels(h['labels'])} {h['count']}")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def _format_labels(labels: dict) -> str:
+    return ",".join(f"{k}={v}" for k, v in labels.items())
+
+
+def _prom_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    esc = {k: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for k, v in labels.items()}
+    return "{" + ",".join(f'{k}="{v}"' for k, v in esc.items()) + "}"
+
+
+@contextmanager
+def paper_scope(papers: dict[str, float] | str):
+    """在此范围内发生的 LLM 调用计入这些论文；传入 dict 时按权重分摊。"""
+    if isinstance(papers, str):
+        papers = {papers: 1.0}
+    token = _paper_scope.set(papers)
+    try:
+        yield
+    finally:
+        _paper_scope.reset(token)
+
+
+def llm_cost(model_name: str, prompt_tokens: int, completion_tokens: int) -> float:
+    price_in, price_out = MODEL_PRICING.get(model_name, (0.0, 0.0))
+    return (prompt_tokens * price_in + completion_tokens * price_out) / 1_000_000
+
+
+def record_llm_call(provider: str, model_name: str, seconds: float, ok: bool,
+                    prompt_tokens: int = 0, completion_tokens: int = 0):
+    """一次 LLM API 调用：耗时、状态、实际 token 数与费用，按 provider 与当前论文分别累计。"""
+    m = get_metrics()
+    status = "ok" if ok else "error"
+    cost = llm_cost(model_name, prompt_tokens, completion_tokens)
+    m.observe("llm_request_seconds", seconds, provider=provider)
+    m.inc("llm_requests_total", provider=provider, status=status)
+    m.inc("llm_prompt_tokens_total", prompt_tokens, provider=provider)
+    m.inc("llm_completion_tokens_total", completion_tokens, provider=provider)
+    m.inc("llm_cost_usd_total", cost, provider=provider)
+    m.inc_paper("paper_llm_requests_total", provider=provider, status=status)
+    m.inc_paper("paper_llm_seconds_total", seconds, provider=provider)
+    m.inc_paper("paper_llm_prompt_tokens_total", prompt_tokens, provider=provider)
+    m.inc_paper("paper_llm_completion_tokens_total", completion_tokens, provider=provider)
+    m.inc_paper("paper_llm_cost_usd_total", cost, provider=provider)
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    return _metrics
@@ -1,36 +1,146 @@
 import os
+import signal
 import pdfplumber
 import json
+import sqlite3
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+from text_cache import TextCache, TEXT_CACHE_DB
+
+# 抽取逻辑改变（输出文本会不同）时递增，sqlite 缓存据此失效
+EXTRACTOR_VERSION = "2"      # 2: 页间以换页符分隔
+PAGE_BREAK = "\f"
+# 进程池的启动方式：流水线模式下进程池在各阶段线程已运行后才创建，fork 可能复制他人持有的锁而死锁，
+# 因此不用 fork，优先 forkserver（仅 POSIX），否则 spawn
+POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def iter_pdf_pages(pdf_path):
+    """
+    逐页产出PDF文本的生成器。每页解析完立即释放该页的布局缓存，
+    解析时的布局对象不随页数累积（拼接后的全文仍在内存中）。
+    解析失败时异常直接抛给调用方。
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        for page in pdf.pages:
+            page_text = page.extract_text() or ""
+            page.close()
+            yield page_text
 
 def extract_text_from_pdf(pdf_path):
-    text = ""
+    """整篇提取，页与页之间用换页符 PAGE_BREAK 分隔（run.split_into_chunks 依赖它按页切块）。"""
     try:
-        with pdfplumber.open(pdf_path) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        return text.strip()
+        return PAGE_BREAK.join(iter_pdf_pages(pdf_path)).strip()
     except Exception as e:
         print(f"错误：无法解析PDF文件 '{pdf_path}': {e}")
         return None
 
-def process_pdfs_in_directory(pdf_directory, cache_directory):
+def _extract_with_timeout(pdf_path, timeout=None):
     """
-    处理指定目录中的所有PDF文件，提取文本，并使用缓存机制。
+    进程池 worker：在子进程内用 SIGALRM 限制单个PDF的解析时间，超时视为解析失败。
+    没有 SIGALRM 的平台（Windows）上不做单文件超时。
+    """
+    use_alarm = bool(timeout) and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        def _on_timeout(signum, frame):
+            raise TimeoutError(f"解析超过 {timeout} 秒")
+        signal.signal(signal.SIGALRM, _on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return extract_text_from_pdf(pdf_path)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
 
-    Args:
-        pdf_directory (str): 包含PDF文件的目录路径。
-        cache_directory (str): 存储/读取提取文本JSON缓存的目录路径。
+class _JsonTextCache:
+    """旧版缓存：每篇论文一个 JSON 文件，只按 paper_name（文件名）寻址。"""
 
-    Returns:
-        dict: 一个字典，键是PDF文件名（不含扩展名），值是每个PDF提取的文本。
+    def __init__(self, cache_directory):
+        self.cache_directory = cache_directory
+
+    def _path(self, paper_name):
+        return os.path.join(self.cache_directory, f"{paper_name}.json")
+
+    def get(self, paper_name, pdf_path):
+        """读取缓存文件，返回文本；缓存不存在或损坏时返回 None。"""
+        cache_file_path = self._path(paper_name)
+        if not os.path.exists(cache_file_path):
+            return None
+        try:
+            with open(cache_file_path, 'r', encoding='utf-8') as f_cache:
+                cache_data = json.load(f_cache)
+                text_content = cache_data.get("text")
+                if text_content is None:
+                    print(f"警告：缓存文件 '{cache_file_path}' 格式不正确或缺少'text'字段。将重新解析。")
+                return text_content
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"警告：读取或解析缓存文件 '{cache_file_path}' 失败: {e}。将重新解析PDF。")
+            return None
+
+    def put(self, paper_name, pdf_path, text_content):
+        with open(self._path(paper_name), 'w', encoding='utf-8') as f_cache:
+            json.dump({"paper_name": paper_name, "text": text_content}, f_cache, ensure_ascii=False, indent=4)
+
+    def close(self):
+        pass
+
+def _open_text_cache(cache_directory, cache_backend):
+    """按 cache_backend（"json" / "sqlite"）打开缓存；缓存目录不可用时返回 None。"""
+    if not os.path.isdir(cache_directory):
+        return None
+    if cache_backend == "sqlite":
+        try:
+            return TextCache(os.path.join(cache_directory, TEXT_CACHE_DB), EXTRACTOR_VERSION)
+        except sqlite3.Error as e:
+            print(f"错误：无法打开缓存数据库: {e}")
+            return None
+    return _JsonTextCache(cache_directory)
+
+def _iter_extract_in_pool(pdf_paths, workers, timeout):
+    """用进程池并行解析多个PDF，按完成顺序产出 (pdf_path, text 或 None)。"""
+    context = multiprocessing.get_context(POOL_START_METHOD)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {pool.submit(_extract_with_timeout, path, timeout): path for path in pdf_paths}
+        for future in as_completed(futures):
+            pdf_path = futures[future]
+            try:
+                text_content = future.result()
+            except Exception as e:  # worker 进程崩溃等
+                print(f"错误：无法解析PDF文件 '{pdf_path}': {e}")
+                text_content = None
+            yield pdf_path, text_content
+
+def _iter_extract_serial(pdf_paths):
+    for pdf_path in pdf_paths:
+        print(f"正在处理文件 (解析PDF): {pdf_path}...")
+        yield pdf_path, extract_text_from_pdf(pdf_path)
+
+def _list_pdfs(pdf_directory):
+    """返回目录下所有PDF的 (paper_name, filename, pdf_path)，文件名（不含扩展名）作为论文名。"""
+    return [(os.path.splitext(filename)[0], filename, os.path.join(pdf_directory, filename))
+            for filename in os.listdir(pdf_directory) if filename.lower().endswith(".pdf")]
+
+def list_pdf_files(pdf_directory):
+    """{论文名: PDF路径}，按目录顺序，即 process_pdfs_in_directory 结果的键顺序。"""
+    if not os.path.isdir(pdf_directory):
+        return {}
+    return {paper_name: pdf_path for paper_name, _, pdf_path in _list_pdfs(pdf_directory)}
+
+def list_paper_names(pdf_directory):
+    """目录下所有论文名（按目录顺序）。"""
+    return list(list_pdf_files(pdf_directory))
+
+def iter_pdfs_in_directory(pdf_directory, cache_directory, workers=1, timeout=None, cache_backend="json",
+                           skip=()):
+    """
+    process_pdfs_in_directory 的生成器版本：先产出命中缓存的论文，
+    再按解析完成的顺序产出其余论文，每项为 (paper_name, text)，解析失败时 text 为 ""。
+    参数同 process_pdfs_in_directory；供流水线在整个目录解析完之前就开始下游处理。
     """
-    extracted_data = {}
     if not os.path.isdir(pdf_directory):
         print(f"错误：PDF目录 '{pdf_directory}' 不存在。")
-        return extracted_data
+        return
 
     # 确保缓存目录存在
     if not os.path.exists(cache_directory):
@@ -42,54 +152,69 @@ def process_pdfs_in_directory(pdf_directory, cache_directory):
             # 如果无法创建缓存目录，则不使用缓存，但继续尝试解析
             pass
 
-
-    for filename in os.listdir(pdf_directory):
-        if filename.lower().endswith(".pdf"):
-            paper_name = os.path.splitext(filename)[0] # 文件名作为论文名
-            pdf_path = os.path.join(pdf_directory, filename)
-            cache_file_path = os.path.join(cache_directory, f"{paper_name}.json")
-
-            text_content = None
-
-            # 1. 尝试从缓存加载
-            if os.path.exists(cache_file_path):
-                try:
-                    with open(cache_file_path, 'r', encoding='utf-8') as f_cache:
-                        cache_data = json.load(f_cache)
-                        text_content = cache_data.get("text")
-                        if text_content is not None:
-                            print(f"已从缓存加载 '{paper_name}' 的文本。")
-                        else:
-                            print(f"警告：缓存文件 '{cache_file_path}' 格式不正确或缺少'text'字段。将重新解析。")
-                except (IOError, json.JSONDecodeError) as e:
-                    print(f"警告：读取或解析缓存文件 '{cache_file_path}' 失败: {e}。将重新解析PDF。")
-
-            # 2. 如果缓存中没有或加载失败，则解析PDF
-            if text_content is None:
-                print(f"正在处理文件 (解析PDF): {pdf_path}...")
-                text_content = extract_text_from_pdf(pdf_path)
-
-                if text_content:
-                    # 3. 如果解析成功，保存到缓存
-                    if os.path.isdir(cache_directory):
-                        try:
-                            with open(cache_file_path, 'w', encoding='utf-8') as f_cache:
-                                json.dump({"paper_name": paper_name, "text": text_content}, f_cache, ensure_ascii=False, indent=4)
-                            print(f"已将 '{paper_name}' 的提取文本缓存到 '{cache_file_path}'。")
-                        except IOError as e:
-                            print(f"错误：无法写入缓存文件 '{cache_file_path}': {e}")
-                    else:
-                        print(f"警告：缓存目录 '{cache_directory}' 不可用，无法缓存 '{paper_name}' 的文本。")
-                else:
-                    print(f"未能从 {filename} 提取文本。")
-
+    cache = _open_text_cache(cache_directory, cache_backend)
+    try:
+        # 1. 尝试从缓存加载，未命中的留待解析
+        pending = {}
+        for paper_name, filename, pdf_path in _list_pdfs(pdf_directory):
+            if paper_name in skip:
+                continue
+            text_content = cache.get(paper_name, pdf_path) if cache else None
+            if text_content is not None:
+                print(f"已从缓存加载 '{paper_name}' 的文本。")
+                yield paper_name, text_content
+            else:
+                pending[pdf_path] = (paper_name, filename)
+
+        # 2. 解析缓存中没有或加载失败的PDF（并行或串行）
+        if workers > 1 and len(pending) > 1:
+            print(f"使用 {workers} 个进程并行解析 {len(pending)} 个PDF...")
+            parsed = _iter_extract_in_pool(list(pending), workers, timeout)
+        else:
+            parsed = _iter_extract_serial(list(pending))
+
+        # 3. 如果解析成功，保存到缓存
+        for pdf_path, text_content in parsed:
+            paper_name, filename = pending[pdf_path]
             if text_content:
-                extracted_data[paper_name] = text_content
+                if cache:
+                    try:
+                        cache.put(paper_name, pdf_path, text_content)
+                        print(f"已将 '{paper_name}' 的提取文本缓存到 '{cache_directory}'。")
+                    except (IOError, sqlite3.Error) as e:
+                        print(f"错误：无法写入 '{paper_name}' 的缓存: {e}")
+                else:
+                    print(f"警告：缓存目录 '{cache_directory}' 不可用，无法缓存 '{paper_name}' 的文本。")
             else:
-                extracted_data[paper_name] = ""
+                print(f"未能从 {filename} 提取文本。")
+            yield paper_name, text_content or ""
+    finally:
+        if cache:
+            cache.close()
+
+def process_pdfs_in_directory(pdf_directory, cache_directory, workers=1, timeout=None, cache_backend="json",
+                              skip=()):
+    """
+    处理指定目录中的所有PDF文件，提取文本，并使用缓存机制。
 
+    Args:
+        pdf_directory (str): 包含PDF文件的目录路径。
+        cache_directory (str): 存储/读取提取文本缓存的目录路径。
+        workers (int): 解析未命中缓存的PDF时使用的进程数；1 表示在主进程中串行解析。
+        timeout (float): 并行模式下单个PDF的解析超时（秒），None 表示不限。
+        cache_backend (str): "json" 为按文件名的旧版JSON缓存；
+                             "sqlite" 为按内容哈希寻址、记录抽取器版本的压缩缓存（见 text_cache.py）。
+        skip (Container[str]): 不需要处理的论文名（如断点续跑时已完成的论文），既不读缓存也不解析。
 
-    return extracted_data
+    Returns:
+        dict: 一个字典，键是PDF文件名（不含扩展名），值是每个PDF提取的文本。
+    """
+    extracted = dict(iter_pdfs_in_directory(pdf_directory, cache_directory, workers, timeout, cache_backend, skip))
+    if not extracted:
+        return {}
+    # 按目录顺序返回，与逐个处理时一致
+    return {paper_name: extracted[paper_name] for paper_name, _, _ in _list_pdfs(pdf_directory)
+            if paper_name in extracted}
 
 if __name__ == '__main__':
     # 这是一个示例，展示如何使用此模块
@@ -0,0 +1,93 @@
+import re
+import threading
+from collections import Counter
+from typing import Iterable
+
+# 数据集信号：关键词（英 / 中）
+_KEYWORD_PAT = re.compile(
+    r"""(?ix)
+    \b(?:datasets?|data\s+sets?|corpus|corpora|benchmarks?|
+       train(?:ing)?\s+(?:set|split|data)|test(?:ing)?\s+(?:set|split)|validation\s+(?:set|split)|dev\s+set|
+       annotations?|annotated|
+       (?:we\s+)?(?:use|evaluate|train|experiment)(?:d|s)?\s+(?:on|with)|
+       publicly\s+available|download(?:ed|able)?|released?)\b
+    |数据集|语料|基准|训练集|测试集
+""")
+# 链接与常见托管平台
+_URL_PAT = re.compile(
+    r"(?i)(?:https?://|www\.)\S+|\b(?:github\.com|huggingface\.co|kaggle\.com|zenodo\.org|figshare\.com)\S*"
+)
+_TOKEN_PAT = re.compile(r"[a-z0-9]+")
+
+# 各类信号的权重与单类计分上限（防止一块里的大量同类命中压过其他信号）
+WEIGHTS = {"keyword": 1.0, "url": 2.0, "name": 3.0}
+_MAX_HITS = 3
+_MAX_NAME_TOKENS = 6
+
+
+def _name_tokens(name: str) -> tuple[str, ...]:
+    return tuple(_TOKEN_PAT.findall(name.lower()))
+
+
+class DatasetSignalScorer:
+    """
+    LLM 之前的本地打分：关键词 / 正则、已知数据集名词典（n-gram 哈希查找）与 URL 检测。
+    score 低于阈值的块不送 LLM。线程安全，并统计放行 / 跳过与各类命中数。
+    """
+
+    def __init__(self, known_names: Iterable[str] = (), threshold: float = 1.0):
+        self.threshold = threshold
+        self._names: set[tuple[str, ...]] = set()
+        self._max_n = 1
+        self._lock = threading.Lock()
+        self.stats = Counter()
+        self.add_names(known_names)
+
+    def add_names(self, names: Iterable[str]):
+        """加入已知数据集名；单个过短的词（如 "a"、"qa"）不加入，避免误命中。"""
+        with self._lock:
+            for name in names:
+                toks = _name_tokens(name)
+                if not toks or len(toks) > _MAX_NAME_TOKENS:
+                    continue
+                if len(toks) == 1 and len(toks[0]) < 3:
+                    continue
+                self._names.add(toks)
+                self._max_n = max(self._max_n, len(toks))
+
+    def _count_names(self, text: str) -> int:
+        toks = _TOKEN_PAT.findall(text.lower())
+        found = set()
+        with self._lock:
+            names, max_n = self._names, self._max_n
+        for i in range(len(toks)):
+            for n in range(1, min(max_n, len(toks) - i) + 1):
+                gram = tuple(toks[i:i + n])
+                if gram in names:
+                    found.add(gram)
+        return len(found)
+
+    def score(self, chunk: str) -> float:
+        hits = {
+            "keyword": len(_KEYWORD_PAT.findall(chunk)),
+            "url": len(_URL_PAT.findall(chunk)),
+            "name": self._count_names(chunk),
+        }
+        with self._lock:
+            for kind, n in hits.items():
+                self.stats[f"{kind}_hits"] += n
+        return sum(WEIGHTS[kind] * min(n, _MAX_HITS) for kind, n in hits.items())
+
+    def keep(self, chunk: str) -> bool:
+        passed = self.score(chunk) >= self.threshold
+        with self._lock:
+            self.stats["chunks"] += 1
+            self.stats["passed" if passed else "skipped"] += 1
+        return passed
+
+    def summary(self) -> str:
+        s = self.stats
+        total = s["chunks"] or 1
+        return (f"共 {s['chunks']} 块，送 LLM {s['passed']} 块，跳过 {s['skipped']} 块"
+                f"（{100 * s['skipped'] / total:.0f}%）；命中 关键词 {s['keyword_hits']}、"
+                f"URL {s['url_hits']}、已知数据集名 {s['name_hits']}")
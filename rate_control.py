@@ -0,0 +1,340 @@
+import time
+import random
+import threading
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+WINDOW_SECONDS = 60.0
+MIN_RATE_SCALE = 0.1           # 连续 429 后有效限额最低降到配置值的 10%
+RATE_RECOVERY_STEP = 0.05      # 每次成功请求恢复的比例（加性增、乘性减）
+BREAKER_FAILURE_THRESHOLD = 5  # 连续失败多少次后熔断
+BREAKER_RESET_TIMEOUT = 30.0   # 熔断后多少秒放行一个探测请求
+RETRY_MAX_DELAY = 60.0         # 单次退避等待上限（秒）
+LATENCY_EWMA_ALPHA = 0.3       # provider 延迟滑动平均的权重
+ROUTER_MIN_SHARE = 0.05        # 较慢 / 刚失败过的 provider 至少保留的相对得分，保证还有请求去探测它是否恢复
+ROUTER_PENALTY_MAX_LATENCY = 600.0   # 失败惩罚放大延迟估计的上限（秒）；估计已高于此值时保持不变，不会被调低
+
+
+# ----------------------------------------------------
+#                  错误分类
+# ----------------------------------------------------
+class LLMError(Exception):
+    """LLM 调用失败的基类；retryable 决定 call_with_retry 是否重试，retry_after 为服务端建议的等待秒数。"""
+
+    retryable = True
+
+    def __init__(self, message: str, provider: str | None = None,
+                 status: int | None = None, retry_after: float | None = None):
+        super().__init__(message)
+        self.provider = provider
+        self.status = status
+        self.retry_after = retry_after
+
+
+class RateLimitError(LLMError):
+    """429：配额耗尽，按 Retry-After 等待，同时收紧该 provider 的限速。"""
+
+
+class ServerError(LLMError):
+    """5xx：服务端临时故障。"""
+
+
+class TransientError(LLMError):
+    """连接失败、超时等网络层临时错误。"""
+
+
+class ResponseFormatError(LLMError):
+    """响应体不是预期的 JSON 结构（网关返回了 HTML 等），通常重试即可恢复。"""
+
+
+class ClientError(LLMError):
+    """其余 4xx（鉴权失败、请求非法等）：重试无益。"""
+
+    retryable = False
+
+
+class CircuitOpenError(LLMError):
+    """该 provider 已熔断；retry_after 为距离放行探测请求的剩余秒数。"""
+
+
+def error_for_status(status: int, message: str, provider: str | None = None,
+                     retry_after: float | None = None) -> LLMError:
+    """按 HTTP 状态码构造对应的错误类型。"""
+    if status == 429:
+        cls = RateLimitError
+    elif status >= 500:
+        cls = ServerError
+    elif status in (408, 409):
+        cls = TransientError
+    else:
+        cls = ClientError
+    return cls(message, provider=provider, status=status, retry_after=retry_after)
+
+
+def parse_retry_after(headers) -> float | None:
+    """解析 Retry-After（秒数或 HTTP 日期）与 retry-after-ms 响应头，取不到时返回 None。"""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(float(value) / 1000, 0.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """LLMError 按类型判断；其他异常（解析源网络错误等）沿用原先“都重试”的行为，可用 retryable=False 属性排除。"""
+    return getattr(exc, "retryable", True)
+
+
+def backoff_delay(delay: float, exc: BaseException | None = None) -> float:
+    """
+    带抖动的退避时间：在 [delay/2, delay] 内均匀取值，避免并发 worker 同步重试；
+    服务端给了 Retry-After 时至少等待该时长。
+    """
+    wait = min(delay, RETRY_MAX_DELAY)
+    wait = wait / 2 + random.uniform(0, wait / 2)
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after:
+        wait = max(wait, retry_after + random.uniform(0, 1))
+    return wait
+
+
+# ----------------------------------------------------
+#                  自适应限速
+# ----------------------------------------------------
+class RateLimiter:
+    """
+    滑动窗口限速器：同时限制每分钟请求数（rpm）与 token 数（tpm），线程安全。
+    rpm / tpm 为 None 表示该维度不限。
+    自适应：收到 429 时有效限额减半并让所有 worker 一起暂停到 Retry-After 之后，
+    之后每次成功逐步恢复到配置值（AIMD）。
+    """
+
+    def __init__(self, rpm: int | None = None, tpm: int | None = None,
+                 window: float = WINDOW_SECONDS):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.window = window
+        self._events: deque[tuple[float, int]] = deque()   # (时间戳, tokens)
+        self._tokens = 0
+        self._scale = 1.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def scale(self) -> float:
+        """当前有效限额占配置值的比例，1.0 表示未被 429 收紧。"""
+        return self._scale
+
+    @property
+    def effective_rpm(self) -> int | None:
+        return max(1, int(self.rpm * self._scale)) if self.rpm else None
+
+    @property
+    def effective_tpm(self) -> int | None:
+        return max(1, int(self.tpm * self._scale)) if self.tpm else None
+
+    def _evict(self, now: float):
+        while self._events and self._events[0][0] <= now - self.window:
+            _, tks = self._events.popleft()
+            self._tokens -= tks
+
+    def _wait_time(self, now: float, tokens: int) -> float:
+        wait = max(self._paused_until - now, 0.0)
+        rpm, tpm = self.effective_rpm, self.effective_tpm
+        if rpm and len(self._events) >= rpm:
+            idx = len(self._events) - rpm
+            wait = max(wait, self._events[idx][0] + self.window - now)
+        if tpm and self._events and self._tokens + tokens > tpm:
+            # 找到最早的时间点：窗口内释放足够 token 后本次请求能放行
+            freed = 0
+            for ts, tks in self._events:
+                freed += tks
+                if self._tokens - freed + tokens <= tpm:
+                    break
+            wait = max(wait, ts + self.window - now)
+        return wait
+
+    def acquire(self, tokens: int = 0):
+        """阻塞直到本次请求（估计 tokens 个）满足限速后登记并返回。"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._evict(now)
+                wait = self._wait_time(now, tokens)
+                if wait <= 0:
+                    self._events.append((now, tokens))
+                    self._tokens += tokens
+                    return
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self._scale = min(1.0, self._scale + RATE_RECOVERY_STEP)
+
+    def on_rate_limited(self, retry_after: float | None = None):
+        """收到 429：限额减半；有 Retry-After 时所有等待中的请求都推迟到那之后。"""
+        with self._lock:
+            self._scale = max(MIN_RATE_SCALE, self._scale / 2)
+            if retry_after:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+
+
+# ----------------------------------------------------
+#                  熔断器
+# ----------------------------------------------------
+class CircuitBreaker:
+    """
+    连续失败 failure_threshold 次后熔断，reset_timeout 秒内直接拒绝请求；
+    到时放行一个探测请求（半开），成功则恢复，失败则重新计时。只统计可重试的故障。
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT, name: str = ""):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self._failures = 0
+        self._opened_at: float | None = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset_timeout else "open"
+
+    def before_call(self):
+        """请求前调用；熔断中抛出 CircuitOpenError。"""
+        with self._lock:
+            if self._opened_at is None:
+                return
+            remaining = self._opened_at + self.reset_timeout - time.monotonic()
+            if remaining <= 0 and not self._probing:
+                self._probing = True   # 半开：只放行一个探测请求
+                return
+            raise CircuitOpenError(f"{self.name} 已熔断", provider=self.name,
+                                   retry_after=max(remaining, 1.0))
+
+    def on_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def on_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def configure_rate_limits(limits: dict[str, tuple[int | None, int | None]]):
+    """按 provider 配置限速：{"paid": (rpm, tpm), ...}，会替换已有的限速器。"""
+    with _limiters_lock:
+        for provider, (rpm, tpm) in limits.items():
+            _limiters[provider] = RateLimiter(rpm, tpm)
+
+
+def get_rate_limiter(provider: str) -> RateLimiter:
+    """取 provider 对应的共享限速器；未配置时返回不限速的实例。"""
+    with _limiters_lock:
+        if provider not in _limiters:
+            _limiters[provider] = RateLimiter()
+        return _limiters[provider]
+
+
+# ----------------------------------------------------
+#                  多后端路由
+# ----------------------------------------------------
+class ProviderRouter:
+    """
+    按权重与观测延迟在多个 provider 间分配请求，并给出故障转移顺序。
+    每次 order() 按 权重 × 限速余量 / 延迟滑动平均 做加权随机排序，
+    熔断中的 provider 排到最后（全部熔断时仍按原顺序尝试，由熔断器给出等待时间）。
+    """
+
+    def __init__(self, weights: dict[str, float], alpha: float = LATENCY_EWMA_ALPHA):
+        self.weights = {p: w for p, w in weights.items() if w > 0}
+        self.alpha = alpha
+        self._latency: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, provider: str, seconds: float):
+        with self._lock:
+            old = self._latency.get(provider)
+            self._latency[provider] = seconds if old is None else (1 - self.alpha) * old + self.alpha * seconds
+
+    def penalize(self, provider: str, factor: float = 2.0):
+        """调用失败：把该 provider 的延迟估计放大，后续请求更少路由到它，成功后随滑动平均恢复。"""
+        with self._lock:
+            seen = list(self._latency.values())
+            base = self._latency.get(provider, sum(seen) / len(seen) if seen else 1.0)
+            self._latency[provider] = max(base, min(base * factor, ROUTER_PENALTY_MAX_LATENCY))
+
+    def latency(self, provider: str) -> float | None:
+        with self._lock:
+            return self._latency.get(provider)
+
+    def _score(self, provider: str, default_latency: float) -> float:
+        latency = self._latency.get(provider, default_latency)
+        return self.weights[provider] * get_rate_limiter(provider).scale / max(latency, 1e-3)
+
+    def order(self) -> list[str]:
+        with self._lock:
+            seen = list(self._latency.values())
+            default_latency = sum(seen) / len(seen) if seen else 1.0   # 未观测过的按平均延迟计，先给机会
+            scores = {p: self._score(p, default_latency) for p in self.weights}
+        top = max(scores.values(), default=0.0)
+        scores = {p: max(sc, ROUTER_MIN_SHARE * top) for p, sc in scores.items()}
+        # 加权随机不放回抽样（Efraimidis–Spirakis）：高分者大概率排前，其余仍能分到流量
+        ranked = sorted(scores, key=lambda p: random.random() ** (1 / scores[p]), reverse=True)
+        healthy = [p for p in ranked if get_circuit_breaker(p).state != "open"]
+        return healthy + [p for p in ranked if p not in healthy]
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_router: ProviderRouter | None = None
+
+
+def get_circuit_breaker(provider: str) -> CircuitBreaker:
+    """取 provider 对应的共享熔断器。"""
+    with _limiters_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(name=provider)
+        return _breakers[provider]
+
+
+def configure_provider_router(weights: dict[str, float]):
+    """配置 api_choice="auto" 时参与路由的 provider 及其权重：{"paid": 1.0, "free": 1.0}。"""
+    global _router
+    with _limiters_lock:
+        _router = ProviderRouter(weights)
+
+
+def get_provider_router() -> ProviderRouter:
+    """取共享路由器；未配置时在 paid / free 间等权路由。"""
+    global _router
+    with _limiters_lock:
+        if _router is None:
+            _router = ProviderRouter({"paid": 1.0, "free": 1.0})
+        return _router
@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import argparse
+from typing import Iterable, Iterator
+
+from json_stream import IncrementalEntryParser
+
+# 结果文件有两种格式，按扩展名区分：
+#   .json  —— {论文: {数据集: [...]}}，与以往的输出一致（indent=4）
+#   .jsonl —— 每行一篇：{"paper": 论文, "datasets": {数据集: [...]}}，可逐行流式读写
+READ_CHUNK_SIZE = 1 << 20          # 流式读取 .json 时每次读入的字符数
+
+
+def is_jsonl(path: str) -> bool:
+    return path.lower().endswith(".jsonl")
+
+
+def _parse_line(line: str | bytes, path: str, lineno: int) -> tuple[str, dict]:
+    try:
+        rec = json.loads(line)
+        return rec["paper"], rec["datasets"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"{path} 第 {lineno} 行无法解析：{e}") from e
+
+
+def iter_results(path: str, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[tuple[str, dict]]:
+    """逐篇产出 (论文, 数据集)，不把整个文件读入内存；文件损坏时抛出 ValueError。"""
+    with open(path, "r", encoding="utf-8") as f:
+        if is_jsonl(path):
+            for lineno, line in enumerate(f, 1):
+                if line.strip():
+                    yield _parse_line(line, path, lineno)
+            return
+        # 逐块解析；读完后校验结构完整，截断或非 JSON 的输入抛出 ValueError，而不是只产出前面的部分
+        parser = IncrementalEntryParser(entry_depth=1)
+        first = True
+        while chunk := f.read(chunk_size):
+            if first:
+                head = chunk.lstrip("\ufeff \t\r\n")
+                if head and not head.startswith("{"):
+                    raise ValueError(f"{path} 不是 JSON 对象")
+                first = not head
+            for (paper,), datasets in parser.feed(chunk):
+                yield paper, datasets
+        parser.close()
+
+
+def index_jsonl(path: str) -> dict[str, list[int]]:
+    """.jsonl 结果文件中每篇论文所在行的字节偏移，供按论文随机读取；有无法解析的行时抛出 ValueError。"""
+    index: dict[str, list[int]] = {}
+    offset = 0
+    with open(path, "rb") as f:
+        for lineno, line in enumerate(f, 1):
+            if line.strip():
+                paper, _ = _parse_line(line, path, lineno)
+                index.setdefault(paper, []).append(offset)
+            offset += len(line)
+    return index
+
+
+def read_jsonl_at(f, offset: int) -> tuple[str, dict]:
+    """从以二进制打开的 .jsonl 文件中读出 offset 处的一篇。"""
+    f.seek(offset)
+    rec = json.loads(f.readline())
+    return rec["paper"], rec["datasets"]
+
+
+class ResultWriter:
+    """
+    逐篇写出结果文件，格式按扩展名决定；先写临时文件，close 时原子替换。
+    .json 的输出与 json.dump(全部结果, indent=4) 逐字节相同，但不需要把全部结果留在内存里。
+    出错退出 with 块时丢弃临时文件，不覆盖已有的结果。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.jsonl = is_jsonl(path)
+        self.count = 0
+        self._tmp = path + ".tmp"
+        self._f = open(self._tmp, "w", encoding="utf-8")
+        if not self.jsonl:
+            self._f.write("{")
+
+    def write(self, paper: str, datasets: dict):
+        if self.jsonl:
+            self._f.write(json.dumps({"paper": paper, "datasets": datasets}, ensure_ascii=False) + "\n")
+        else:
+            body = json.dumps({paper: datasets}, ensure_ascii=False, indent=4)[1:-2]
+            self._f.write(("," if self.count else "") + body)
+        self.count += 1
+
+    def write_all(self, results: Iterable[tuple[str, dict]]):
+        for paper, datasets in results:
+            self.write(paper, datasets)
+
+    def close(self):
+        if not self.jsonl:
+            self._f.write("\n}" if self.count else "}")
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+    def abort(self):
+        self._f.close()
+        os.remove(self._tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def convert(src: str, dst: str) -> int:
+    """在 .json 与 .jsonl 之间转换（格式按两边的扩展名决定），返回论文篇数。"""
+    with ResultWriter(dst) as writer:
+        writer.write_all(iter_results(src))
+    return writer.count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="结果文件格式转换（.json <-> .jsonl）")
+    parser.add_argument("src", help="输入文件（.json 或 .jsonl）")
+    parser.add_argument("dst", help="输出文件（.json 或 .jsonl）")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.src):
+        print(f"错误：输入文件 '{args.src}' 不存在。")
+        return 1
+    n = convert(args.src, args.dst)
+    print(f"已转换 {n} 篇论文：{args.src} -> {args.dst}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
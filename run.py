@@ -1,22 +1,76 @@
-import os, re, json, math, time, logging
-from typing import List, Callable, Any
+import os, re, time, queue, logging, threading
+from itertools import accumulate
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Callable, Any, Iterable, Iterator
 
-from pdf_parser import process_pdfs_in_directory
-from llm_agent import extract_datasets_from_text
+from pdf_parser import (process_pdfs_in_directory, iter_pdfs_in_directory, list_paper_names,
+                        list_pdf_files, EXTRACTOR_VERSION)
+from llm_agent import (extract_datasets_from_text, extract_datasets_from_batch,
+                       get_response_cache, configure_http_pool,
+                       PROMPT_VERSION, DEFAULT_PAID_MODEL, DEFAULT_DEEPSEEK_MODEL)
 from dataset_resolver import DatasetResolver
+from dataset_names import AliasIndex
+from rate_control import configure_rate_limits, configure_provider_router, is_retryable, backoff_delay
+from token_counter import count_tokens, get_token_counter
+from split import find_references_heading, REFERENCES_HEADING
+from prefilter import DatasetSignalScorer
+from metrics import get_metrics, paper_scope
+from url_harvester import UrlHarvester
+from result_io import ResultWriter, iter_results
+from checkpoint import ProgressStore, STAGE_DONE, STAGE_EXTRACTED
+from manifest import RunManifest, config_hash
 
 # ============== 全局参数（可按需调整） ==============
 PDF_DIRECTORY_NAME   = "课程作业论文1"
 CACHED_TEXTS_DIR     = "extract"
-OUTPUT_JSON_FILE     = "dataset_extraction_results.json"
+TEXT_CACHE_BACKEND   = "sqlite"    # "sqlite"：按内容哈希的压缩缓存；"json"：按文件名的旧版缓存
+PDF_WORKERS          = os.cpu_count() or 1   # 解析未缓存 PDF 的进程数，1 为串行
+PDF_TIMEOUT          = 300         # 并行解析时单个 PDF 的超时秒数
+OUTPUT_JSON_FILE     = "dataset_extraction_results.json"   # 以 .jsonl 结尾时每行一篇（见 result_io）
+CHECKPOINT_FILE      = "run_progress.jsonl"  # 逐篇断点记录（追加写），只供中断后续跑，结果写出后删除；None 表示不记录
+RESUME               = True        # True：上次运行中断时，跳过断点文件中已完成的论文；False：清空断点重新开始
+INCREMENTAL_MODE     = True        # True：只处理新增 / 内容变化的 PDF，其余沿用 OUTPUT_JSON_FILE 中的旧结果
+MANIFEST_FILE        = "run_manifest.json"   # 上次运行的 PDF 指纹与流水线配置
+METRICS_JSON_FILE    = "run_metrics.json"    # 运行报告：token / 延迟 / 重试 / 费用，按论文、provider、解析源汇总；None 不写
+METRICS_CSV_FILE     = "run_metrics.csv"
+METRICS_PROMETHEUS_FILE = None               # 如 "run_metrics.prom"：Prometheus 文本格式
 
-API_CHOICE           = "paid"      # 透传给 llm_agent.extract_datasets_from_text
+API_CHOICE           = "paid"      # 透传给 llm_agent.extract_datasets_from_text："paid" / "free" / "auto"（按权重与延迟路由并自动故障转移）
+PROVIDER_WEIGHTS     = {           # API_CHOICE="auto" 时各后端的基础权重，0 表示不参与
+    "paid": 1.0,
+    "free": 1.0,
+}
 MODEL_MAX_TOKENS     = 3000       # 单块最多 token（≤ 模型上限）
+SKIP_REFERENCES      = True        # 切块前去掉参考文献列表（其后的附录正文保留）
+SKIP_BOILERPLATE     = True        # 去掉致谢、资助、作者贡献、论文 checklist、impact statement 等段落
+CHUNK_OVERLAP_SENTENCES  = 2       # 每块开头重复上一块末尾的句子数，0 为不重叠
+CHUNK_OVERLAP_MAX_TOKENS = 150     # 重叠部分的 token 上限，从 MODEL_MAX_TOKENS 中预留
+PREFILTER_ENABLED    = True        # 送 LLM 前先本地打分，没有数据集信号的块直接跳过
+PREFILTER_THRESHOLD  = 1.0         # 分数下限：关键词 1 分/个、URL 2 分/个、已知数据集名 3 分/个
+STREAM_RESPONSES     = True        # 流式接收 LLM 输出：每个数据集条目一闭合就开始预取其 URL，与后续生成重叠
+BATCH_CHUNKS         = True        # 多个块（可跨论文）打包进同一个请求，按段返回结果后再拆回各块
+BATCH_MAX_TOKENS     = 24000       # 单个请求中各块正文的 token 总量上限（不含说明部分）
+BATCH_MAX_CHUNKS     = 8           # 单个请求最多打包的块数
 LLM_RETRIES          = 3           # LLM / 网络调用重试次数
 NETWORK_RETRIES      = 3
 INITIAL_DELAY        = 2           # 首次失败后延迟秒数
 BACKOFF_FACTOR       = 2           # 指数退避倍率
+HARVEST_URLS         = True        # 先从论文全文（含脚注与参考文献）中找链接补 URL，找不到的才联网解析
 RESOLVE_TIMEOUT      = 10          # dataset_resolver 联网超时
+RESOLVE_FAN_OUT      = True        # 并发查询所有解析源（按优先级取结果），最坏耗时约一次超时
+BATCH_RESOLVE        = False       # True：全部论文抽取完后对整个语料一次性批量补全 URL（跨论文去重）
+
+CONCURRENT_MODE      = True        # True：跨论文并发调度 chunk；False：逐块串行
+MAX_IN_FLIGHT        = 8           # 同时在途的 LLM 请求上限
+PIPELINE_MODE        = True        # True：解析 / LLM / URL 补全三阶段流水线并行；False：三阶段依次执行
+PIPELINE_QUEUE_SIZE  = 16          # 阶段间队列容量（论文篇数），满时上游阻塞
+LLM_STAGE_WORKERS    = 4           # 同时处于 LLM 阶段的论文数（chunk 并发仍受 MAX_IN_FLIGHT 限制）
+RESOLVE_STAGE_WORKERS = 4          # URL 补全阶段的线程数
+RATE_LIMITS          = {           # 每个 provider 的限速：(请求数/分钟, tokens/分钟)，None 表示不限
+    "paid": (60, 150_000),
+    "free": (60, 300_000),
+}
 
 logging.basicConfig(
     format="%(asctime)s [%(levelname)s] %(message)s",
@@ -24,32 +78,53 @@ logging.basicConfig(
     datefmt="%H:%M:%S",
 )
 
-resolver = DatasetResolver()
-_WORDS_PER_TOKEN = 0.75           # 粗略估计：英文 0.75 词 ≈ 1 token
+resolver = DatasetResolver(fan_out=RESOLVE_FAN_OUT)
+# 数据集名别名索引（与 resolver 共用）：由解析缓存与上次结果中的名字建立，只用于补全 / 预取时归一缓存键
+aliases = resolver.aliases
+configure_rate_limits(RATE_LIMITS)
+configure_provider_router(PROVIDER_WEIGHTS)
+# 已知数据集名取自解析缓存，运行中 LLM 新识别的名字也会陆续加入
+scorer = DatasetSignalScorer(resolver.known_names(), PREFILTER_THRESHOLD) if PREFILTER_ENABLED else None
+configure_http_pool(max(MAX_IN_FLIGHT, 1))
+# 启动时选定 token 计数器：没有精确计数（tiktoken / 词表）时在这里告警一次，而不是切块中途
+get_token_counter()
 
 # ----------------------------------------------------
 #                通用工具
 # ----------------------------------------------------
 def token_estimate(text: str) -> int:
-    """不用 tiktoken，快速估算 token 数。"""
-    return math.ceil(len(text.split()) / _WORDS_PER_TOKEN)
+    """token 数：装了 tiktoken 时为 BPE 精确计数，否则为离线估计（见 token_counter），按文本段缓存。"""
+    return count_tokens(text)
 
 def call_with_retry(func: Callable[..., Any], /, *args,
                     retries: int = LLM_RETRIES,
                     initial_delay: int = INITIAL_DELAY,
                     backoff: int = BACKOFF_FACTOR,
                     **kwargs):
-    """带指数退避的重试装饰器。"""
+    """
+    带指数退避的重试装饰器。退避带抖动、遵守 Retry-After；
+    不可重试的错误（如鉴权失败等 4xx，见 rate_control.is_retryable）立即抛出。
+    耗时（含重试等待）、重试次数与最终失败次数计入 metrics。
+    """
+    metrics = get_metrics()
     delay = initial_delay
+    start = time.perf_counter()
     for attempt in range(1, retries + 1):
         try:
-            return func(*args, **kwargs)
+            result = func(*args, **kwargs)
+            metrics.observe("call_with_retry_seconds", time.perf_counter() - start, func=func.__name__)
+            return result
         except Exception as e:
-            if attempt == retries:
+            if attempt == retries or not is_retryable(e):
+                metrics.inc("call_with_retry_failures_total", func=func.__name__, error=type(e).__name__)
+                metrics.observe("call_with_retry_seconds", time.perf_counter() - start, func=func.__name__)
                 raise
-            logging.warning("调用 %s 第 %d/%d 次失败：%s；%d 秒后重试",
-                            func.__name__, attempt, retries, e, delay)
-            time.sleep(delay)
+            metrics.inc("call_with_retry_retries_total", func=func.__name__, error=type(e).__name__)
+            metrics.inc_paper("paper_retries_total", func=func.__name__)
+            wait = backoff_delay(delay, e)
+            logging.warning("调用 %s 第 %d/%d 次失败（%s）：%s；%.1f 秒后重试",
+                            func.__name__, attempt, retries, type(e).__name__, e, wait)
+            time.sleep(wait)
             delay *= backoff
 
 # ----------------------------------------------------
@@ -67,9 +142,26 @@ _heading_pat = re.compile(
     [A-Z].{0,80}$      # 后面必须还有正文（全大写/首字大写）
 """)
 
-def _split_long_chunk(chunk: str, max_tokens: int, min_tokens: int = None) -> List[str]:
+def _pack_segments(segments: List[str], counts: List[int], max_tokens: int,
+                   min_tokens: int, sep: str) -> List[tuple[str, int]]:
+    """
+    用前缀和把相邻段贪心合并成接近 max_tokens 的块，返回 [(块, token 数)]；
+    每段只计数一次，整体线性时间。
+    """
+    prefix = list(accumulate(counts, initial=0))
+    pieces, start = [], 0
+    for i in range(1, len(segments)):
+        buf_tokens = prefix[i] - prefix[start]
+        if buf_tokens + counts[i] > max_tokens and buf_tokens >= min_tokens:
+            pieces.append((sep.join(segments[start:i]), buf_tokens))
+            start = i
+    pieces.append((sep.join(segments[start:]), prefix[-1] - prefix[start]))
+    return pieces
+
+def _split_long_chunk(chunk: str, max_tokens: int, min_tokens: int = None) -> List[tuple[str, int]]:
     """
     拆分超长文本块，优先按标题，其次按段落，尽量让每块接近 max_tokens。
+    返回 [(块, token 数)]。
     """
     if min_tokens is None:
         min_tokens = int(0.75 * max_tokens)
@@ -78,104 +170,760 @@ def _split_long_chunk(chunk: str, max_tokens: int, min_tokens: int = None) -> Li
     idxs = [0] + [m.start() for m in _heading_pat.finditer(chunk)] + [len(chunk)]
     subsecs = [chunk[idxs[i]:idxs[i + 1]].strip() for i in range(len(idxs) - 1)]
     subsecs = [s for s in subsecs if s]
+    counts = [token_estimate(s) for s in subsecs]
 
-    if len(subsecs) > 1 and max(token_estimate(s) for s in subsecs) < max_tokens:
+    if len(subsecs) > 1 and max(counts) < max_tokens:
         # 合并 subsecs 使得每块 ≈ max_tokens
-        pieces, buf, buf_tokens = [], [], 0
-        for s in subsecs:
-            tks = token_estimate(s)
-            if buf_tokens + tks > max_tokens and buf_tokens >= min_tokens:
-                pieces.append("\n\n".join(buf))
-                buf, buf_tokens = [s], tks
-            else:
-                buf.append(s)
-                buf_tokens += tks
-        if buf:
-            pieces.append("\n\n".join(buf))
-        return pieces
+        return _pack_segments(subsecs, counts, max_tokens, min_tokens, "\n\n")
 
     # 2) 按段落拆（双换行）
     paras = [p.strip() for p in chunk.split("\n\n") if p.strip()]
-    pieces, buf, buf_tokens = [], [], 0
-    for p in paras:
-        tks = token_estimate(p)
-        if buf_tokens + tks > max_tokens and buf_tokens >= min_tokens:
-            pieces.append("\n\n".join(buf))
-            buf, buf_tokens = [p], tks
-        else:
-            buf.append(p)
-            buf_tokens += tks
-    if buf:
-        pieces.append("\n\n".join(buf))
-    return pieces
+    if not paras:
+        return [(chunk, token_estimate(chunk))]
+    return _pack_segments(paras, [token_estimate(p) for p in paras], max_tokens, min_tokens, "\n\n")
 
-def split_into_chunks(text: str, max_tokens: int = MODEL_MAX_TOKENS) -> List[str]:
-    pages = re.split(r"\f", text)
-    if len(pages) <= 1:
-        logging.warning("未检测到换页符，强制按字符数分割")
-        pages = [text[i:i+5000] for i in range(0, len(text), 5000)]
+def _enforce_max_tokens(chunk: str, max_tokens: int) -> Iterator[tuple[str, int]]:
+    """
+    把仍超过 max_tokens 的块继续细分，按原文顺序产出 (块, token 数)。
+    打包时用的是各段计数之和，只是估计（BPE 计数不可加，分隔符也未计入），这里按整块重新计数。
+    """
+    stack = [chunk]
+    while stack:
+        ck = stack.pop()
+        tks = token_estimate(ck)
+        if tks <= max_tokens or len(ck) <= 1:
+            yield ck, tks
+            continue
+        logging.debug("块 %d tokens > max_tokens，强制细分", tks)
+        ck_splits = _split_long_chunk(ck, max_tokens)
+        if len(ck_splits) == 1:
+            logging.warning("标题/段落分割无效，强制按字符数分割")
+            # 按 token 超出比例估算每段字符数（留一成余量），切出的段仍压回栈里重新计数，保证产出的块都不超过 max_tokens
+            step = max(1, min(len(ck) // 2, len(ck) * max_tokens * 9 // (tks * 10)))
+            stack.extend(ck[i:i + step] for i in reversed(range(0, len(ck), step)))
+            continue
+        stack.extend(piece for piece, _ in reversed(ck_splits))
 
-    logging.debug("初始页面数: %d", len(pages))
-    chunks, buf, buf_tokens = [], [], 0
+def _iter_counted_chunks(pages: Iterable[str], max_tokens: int) -> Iterator[tuple[str, int]]:
+    buf, buf_tokens = [], 0
     for pg in pages:
+        if not pg.strip():
+            continue
         tks = token_estimate(pg)
         if tks > max_tokens:
             logging.debug("单页 %d tokens > max_tokens，细分", tks)
-            chunks.extend(_split_long_chunk(pg, max_tokens))
+            if buf:
+                yield from _enforce_max_tokens("\f".join(buf), max_tokens)
+                buf, buf_tokens = [], 0
+            for piece, _ in _split_long_chunk(pg, max_tokens):
+                yield from _enforce_max_tokens(piece, max_tokens)
             continue
-        if buf_tokens + tks > max_tokens and buf:
-            chunks.append("\f".join(buf))
+        if buf_tokens + tks + 1 > max_tokens and buf:     # +1：页间的换页符
+            yield from _enforce_max_tokens("\f".join(buf), max_tokens)
             buf, buf_tokens = [pg], tks
         else:
             buf.append(pg)
-            buf_tokens += tks
+            buf_tokens += tks + 1
 
     if buf:
-        chunks.append("\f".join(buf))
-
-    final_chunks = []
-    for ck in chunks:
-        while token_estimate(ck) > max_tokens:
-            logging.debug("块 %d tokens > max_tokens，强制细分", token_estimate(ck))
-            ck_splits = _split_long_chunk(ck, max_tokens)
-            if len(ck_splits) == 1 and token_estimate(ck_splits[0]) > max_tokens:
-                logging.warning("标题/段落分割无效，强制按字符数分割")
-                ck_splits = [ck[i:i+2000] for i in range(0, len(ck), 2000)]
-            ck = ck_splits[0]
-            final_chunks.extend(ck_splits[1:])
-        final_chunks.append(ck)
+        yield from _enforce_max_tokens("\f".join(buf), max_tokens)
+
+def iter_page_chunks(pages: Iterable[str], max_tokens: int = MODEL_MAX_TOKENS) -> Iterator[str]:
+    """
+    按页切块：逐页消费，缓冲区满一块就产出一块；块内页与页之间保留换页符。
+    流水线中的输入是整篇解析、过滤后的全文按换页符拆出的页：参考文献 / 模板段落过滤、
+    全文 URL 收集和文本缓存都需要完整文本，PDF 又在子进程中解析，因此切块仍在整篇解析之后进行。
+    打包按各页计数之和估计，产出前对整块重新计数，保证不超过 max_tokens；
+    整块的计数进入计数器缓存，之后 token_estimate(块) 直接命中。
+    """
+    for ck, _ in _iter_counted_chunks(pages, max_tokens):
+        yield ck
+
+def split_into_chunks(text: str, max_tokens: int = MODEL_MAX_TOKENS) -> List[str]:
+    pages = text.split("\f")
+    if len(pages) <= 1:
+        logging.warning("未检测到换页符，强制按字符数分割")
+        pages = [text[i:i+5000] for i in range(0, len(text), 5000)]
 
+    logging.debug("初始页面数: %d", len(pages))
+    final_chunks = list(iter_page_chunks(pages, max_tokens))
     logging.debug("最终块数: %d, 各块token数: %s", len(final_chunks), [token_estimate(ck) for ck in final_chunks])
     return final_chunks
 
+# ----------------------------------------------------
+#      切块前过滤：参考文献、模板化段落；块间句子重叠
+# ----------------------------------------------------
+# 附录 / 补充材料的开头，标志参考文献列表结束
+_appendix_pat = re.compile(
+    r"""(?mx)(?:^|(?<=\f))[ \t]*
+    (?:(?:APPENDIX|APPENDICES|Appendix|Appendices|SUPPLEMENTARY\s+MATERIALS?|Supplementary\s+Materials?)\b.{0,80}
+      |[A-H][ \t]+[A-Z][A-Za-z \-:]{3,60})     # "A Additional Experiments"
+    [ \t]*(?=$|\f)
+""")
+_boilerplate_pat = re.compile(
+    r"""(?imx)(?:^|(?<=\f))[ \t]*(?:\d{1,2}\.?[ \t]*)?
+    (?P<kind>ACKNOWLEDG(?:E)?MENTS?|FUNDING|AUTHOR\s+CONTRIBUTIONS?|
+       (?:NEURIPS\s+)?PAPER\s+CHECKLIST|BROADER\s+IMPACTS?(?:\s+STATEMENT)?|IMPACT\s+STATEMENT)
+    (?=[ \t]*(?:[.:]|$|\f))
+""")
+_BOILERPLATE_MAX_CHARS = 3000      # 致谢等短段落最多删这么长，防止找不到下一标题时误删正文
+_sentence_end = re.compile(r"(?<=[.!?。！？])\s+")
+
+def _next_boundary(text: str, pos: int, patterns) -> int:
+    starts = [m.start() for m in (p.search(text, pos) for p in patterns) if m]
+    return min(starts, default=len(text))
+
+def strip_non_content(text: str, references: bool = SKIP_REFERENCES,
+                      boilerplate: bool = SKIP_BOILERPLATE) -> str:
+    """
+    去掉参考文献列表（到附录 / 下一模板段落为止）以及致谢、checklist 等模板段落。
+    被删区间内的换页符原样保留，切块仍能按页进行。
+    """
+    spans = []
+    if references:
+        m = find_references_heading(text)
+        if m:
+            spans.append((m.start(), _next_boundary(text, m.end(), (_appendix_pat, _boilerplate_pat))))
+    if boilerplate:
+        for m in _boilerplate_pat.finditer(text):
+            if "CHECKLIST" in m.group("kind").upper():
+                # checklist 内部的编号条目也像标题，只在附录 / 参考文献处结束
+                end = _next_boundary(text, m.end(), (_appendix_pat, REFERENCES_HEADING))
+            else:
+                end = _next_boundary(text, m.end(),
+                                     (_heading_pat, _appendix_pat, REFERENCES_HEADING, _boilerplate_pat))
+                end = min(end, m.start() + _BOILERPLATE_MAX_CHARS)
+            spans.append((m.start(), end))
+    if not spans:
+        return text
+
+    out, pos = [], 0
+    for start, end in sorted(spans):
+        if end <= pos:
+            continue
+        start = max(start, pos)
+        out.append(text[pos:start])
+        out.append("\f" * text.count("\f", start, end))
+        pos = end
+    out.append(text[pos:])
+    stripped = "".join(out)
+    logging.debug("过滤参考文献 / 模板段落：%d → %d 字符", len(text), len(stripped))
+    return stripped
+
+def _tail_sentences(text: str, n: int, max_tokens: int) -> str:
+    """取 text 末尾至多 n 个句子，总长不超过 max_tokens。"""
+    sentences = [s for s in _sentence_end.split(text[-4000:]) if s.strip()][-n:]
+    tail, tokens = [], 0
+    for sent in reversed(sentences):
+        tks = token_estimate(sent)
+        if tokens + tks > max_tokens:
+            break
+        tail.insert(0, sent.strip())
+        tokens += tks
+    return " ".join(tail)
+
+def add_chunk_overlap(chunks: List[str], sentences: int = CHUNK_OVERLAP_SENTENCES,
+                      max_tokens: int = CHUNK_OVERLAP_MAX_TOKENS) -> List[str]:
+    """每块开头拼上前一块末尾的几个句子，避免数据集名称或其链接被块边界截断。"""
+    if sentences <= 0 or len(chunks) < 2:
+        return chunks
+    out = [chunks[0]]
+    for prev, ck in zip(chunks, chunks[1:]):
+        tail = _tail_sentences(prev, sentences, max_tokens)
+        out.append(f"{tail}\n\n{ck}" if tail else ck)
+    return out
+
+def prepare_chunks(full_txt: str) -> List[str]:
+    """
+    切块阶段：按配置过滤参考文献 / 模板段落，切块，加上块间句子重叠，
+    最后用 scorer 丢掉没有数据集信号的块。
+    """
+    text = strip_non_content(full_txt) if (SKIP_REFERENCES or SKIP_BOILERPLATE) else full_txt
+    overlap_budget = CHUNK_OVERLAP_MAX_TOKENS if CHUNK_OVERLAP_SENTENCES > 0 else 0
+    chunks = add_chunk_overlap(split_into_chunks(text, MODEL_MAX_TOKENS - overlap_budget))
+    if scorer:
+        chunks = [ck for ck in chunks if scorer.keep(ck)]
+    return chunks
+
+def _log_chunks(paper: str, chunks: List[str]):
+    tot_tokens = sum(token_estimate(c) for c in chunks)
+    logging.info("⇨《%s》拆成 %d 块（估计 %d tokens）", paper, len(chunks), tot_tokens)
+    metrics = get_metrics()
+    metrics.inc("paper_chunks_total", len(chunks), paper=paper)
+    metrics.inc("paper_chunk_tokens_estimated_total", tot_tokens, paper=paper)
+
 # ----------------------------------------------------
 #                URL 补全（带重试）
 # ----------------------------------------------------
+_MISSING_URL = ("", "N/A", "null", None, "Not specified", "URL redacted")
+
+class UrlPrefetcher:
+    """
+    流式抽取时的 URL 预取：条目一出现就在后台解析，结果落入 resolver 的缓存，
+    之后 enrich_all 查缓存即可命中。同名只预取一次；补全前先等同名的预取完成，避免重复联网。
+    """
+    def __init__(self, workers: int = RESOLVE_STAGE_WORKERS):
+        self._pool = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix="prefetch")
+        self._futures: dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _resolve(self, name: str):
+        try:
+            resolver.resolve_many([name], timeout=RESOLVE_TIMEOUT)
+        except Exception as e:
+            logging.debug("预取 %s 的 URL 失败：%s", name, e)
+
+    def submit(self, name: str, info: list):
+        if len(info) > 1 and info[1] not in _MISSING_URL:
+            return
+        name = aliases.canonical(name)
+        with self._lock:
+            if name not in self._futures:
+                self._futures[name] = self._pool.submit(self._resolve, name)
+                get_metrics().inc("url_prefetch_total")
+
+    def wait(self, names: Iterable[str]):
+        with self._lock:
+            futs = [self._futures[n] for n in {aliases.canonical(n) for n in names} if n in self._futures]
+        for fut in futs:
+            fut.result()
+
+prefetcher = UrlPrefetcher() if STREAM_RESPONSES else None
+
+# 正在抽取中的论文的全文链接索引（论文名 -> UrlHarvester），供预取前先查本地
+_harvesters: dict[str, UrlHarvester] = {}
+_harvesters_lock = threading.Lock()
+
+def open_harvester(paper: str, full_txt: str) -> UrlHarvester | None:
+    if not HARVEST_URLS:
+        return None
+    harvester = UrlHarvester(full_txt)
+    with _harvesters_lock:
+        _harvesters[paper] = harvester
+    return harvester
+
+def close_harvester(paper: str, datasets: dict[str, list]):
+    """用论文全文中的链接补上缺失的 URL（就地修改），并释放该论文的索引。"""
+    with _harvesters_lock:
+        harvester = _harvesters.pop(paper, None)
+    if harvester is None:
+        return
+    filled = harvester.fill(datasets, _MISSING_URL)
+    if filled:
+        logging.info("  ⌕《%s》从正文中补全 URL %d 个", paper, filled)
+        get_metrics().inc("url_harvest_filled_total", filled, paper=paper)
+
+def _prefetch(paper: str, name: str, info: list):
+    """流式条目 -> 预取 URL；论文正文里已有链接的不联网。"""
+    with _harvesters_lock:
+        harvester = _harvesters.get(paper)
+    if harvester and harvester.find(name):
+        return
+    prefetcher.submit(name, info)
+
+def enrich_all(results: dict[str, dict[str, list]]) -> dict[str, dict[str, list]]:
+    """
+    整批补全 URL：收集所有论文中缺 URL 的数据集名，跨论文去重后
+    只调用一次 resolver.resolve_many（一次批量查缓存、一次事务写回）。
+    """
+    wanted = []
+    for dataset_dict in results.values():
+        for name, info in dataset_dict.items():
+            if len(info) < 3:
+                info.extend(["N/A"] * (3 - len(info)))
+            if info[1] in _MISSING_URL:
+                wanted.append(name)
+    if not wanted:
+        return results
+
+    if prefetcher:
+        prefetcher.wait(wanted)
+    urls = call_with_retry(
+        resolver.resolve_many, wanted,
+        retries=NETWORK_RETRIES,
+        initial_delay=INITIAL_DELAY,
+        backoff=BACKOFF_FACTOR,
+        timeout=RESOLVE_TIMEOUT
+    )
+    for dataset_dict in results.values():
+        for name, info in dataset_dict.items():
+            if info[1] in _MISSING_URL and urls.get(name):
+                info[1] = urls[name]
+    return results
+
 def enrich_with_urls(dataset_dict: dict[str, list]) -> dict[str, list]:
-    for name, info in dataset_dict.items():
-        if len(info) < 3:
-            info.extend(["N/A"] * (3 - len(info)))
-        if info[1] in ("", "N/A", "null", None, "Not specified", "URL redacted"):
-            url = resolver.resolve(name, no_fetch=True)
-            if not url:    # 只有联网时才做重试
-                url = call_with_retry(
-                    resolver.resolve, name,
-                    retries=NETWORK_RETRIES,
-                    initial_delay=INITIAL_DELAY,
-                    backoff=BACKOFF_FACTOR,
-                    timeout=RESOLVE_TIMEOUT
-                )
-            if url:
-                info[1] = url
-    return dataset_dict
-
-def aggregate_datasets(chunk_results: List[dict[str, list]]) -> dict[str, list]:
+    return enrich_all({"": dataset_dict})[""]
+
+def _log_enriched(paper: str, enriched: dict[str, list]):
+    ok_count = sum(1 for v in enriched.values() if v[1] != "N/A")
+    logging.info("  ▶《%s》识别 %d 个数据集，成功解析 URL %d 个", paper, len(enriched), ok_count)
+
+# ----------------------------------------------------
+#           LLM 抽取：串行 / 并发两种调度
+# ----------------------------------------------------
+ChunkItem = tuple[str, int, str]    # (论文名, 块序号, 块文本)
+
+def pack_batches(items: List[ChunkItem], max_tokens: int = BATCH_MAX_TOKENS,
+                 max_chunks: int = BATCH_MAX_CHUNKS) -> List[List[ChunkItem]]:
+    """按原顺序把相邻块贪心装入批次，每批不超过 max_chunks 块、max_tokens 个正文 token。"""
+    batches, cur, cur_tokens = [], [], 0
+    for item in items:
+        tokens = token_estimate(item[2])
+        if cur and (len(cur) >= max_chunks or cur_tokens + tokens > max_tokens):
+            batches.append(cur)
+            cur, cur_tokens = [], 0
+        cur.append(item)
+        cur_tokens += tokens
+    if cur:
+        batches.append(cur)
+    return batches
+
+def _chunk_label(paper: str, idx: int) -> str:
+    return f"{paper} – chunk {idx}"
+
+def _extract_chunk(paper: str, idx: int, chunk: str, api_choice: str) -> dict[str, list] | None:
+    """单块抽取（带重试），失败记录日志后返回 None。"""
+    try:
+        with paper_scope(paper):
+            res = call_with_retry(
+                extract_datasets_from_text, _chunk_label(paper, idx), chunk,
+                api_choice=api_choice,
+                on_entry=(lambda name, info: _prefetch(paper, name, info)) if prefetcher else None,
+                retries=LLM_RETRIES,
+                initial_delay=INITIAL_DELAY,
+                backoff=BACKOFF_FACTOR,
+            )
+        return res or {}
+    except Exception as e:
+        logging.warning("      ✗ LLM 失败《%s》chunk %d：%s", paper, idx, e)
+        return None
+
+def extract_batch(batch: List[ChunkItem], api_choice: str = API_CHOICE) -> List[dict[str, list] | None]:
+    """
+    一批块合成一个请求，结果按段拆回，与 batch 一一对应（失败的块为 None）。
+    整批失败或响应无法按段拆分时，退回逐块请求。
+    """
+    if len(batch) == 1:
+        return [_extract_chunk(*batch[0], api_choice)]
+    paper, idx, _ = batch[0]
+    label = f"{_chunk_label(paper, idx)} 等 {len(batch)} 块"
+    # 跨论文的批次按各论文的块数分摊 token / 费用
+    weights: dict[str, float] = {}
+    for p, _, _ in batch:
+        weights[p] = weights.get(p, 0) + 1 / len(batch)
+    try:
+        with paper_scope(weights):
+            res = call_with_retry(
+                extract_datasets_from_batch, label, [ck for _, _, ck in batch],
+                api_choice=api_choice,
+                on_entry=(lambda i, name, info: _prefetch(batch[i][0], name, info)) if prefetcher else None,
+                retries=LLM_RETRIES,
+                initial_delay=INITIAL_DELAY,
+                backoff=BACKOFF_FACTOR,
+            )
+    except Exception as e:
+        logging.warning("      ✗ LLM 批量请求失败（%s）：%s", label, e)
+        res = None
+    if res is not None:
+        return res
+    logging.info("      ↺ %s 改为逐块请求", label)
+    return [_extract_chunk(*item, api_choice) for item in batch]
+
+def _collect(papers_chunks: dict[str, List[str]], items: List[ChunkItem],
+             results: List[dict[str, list] | None]) -> dict[str, List[dict[str, list] | None]]:
+    """把与 items 对齐的结果按论文、按块序归位，失败的块保留为 None。"""
+    out: dict[str, List[dict[str, list] | None]] = {paper: [] for paper in papers_chunks}
+    for (paper, _, _), res in zip(items, results):
+        out[paper].append(res)
+    return out
+
+def _flatten(papers_chunks: dict[str, List[str]]) -> List[ChunkItem]:
+    return [(paper, idx, ck)
+            for paper, chunks in papers_chunks.items()
+            for idx, ck in enumerate(chunks, 1)]
+
+def extract_paper_serial(paper: str, chunks: List[str]) -> List[dict[str, list] | None]:
+    """逐块（或逐批）串行调用 LLM，按块序返回结果；重试后仍失败的块为 None。"""
+    items = _flatten({paper: chunks})
+    batches = pack_batches(items) if BATCH_CHUNKS else [[item] for item in items]
+    results = []
+    for n, batch in enumerate(batches, 1):
+        logging.debug("    • LLM 请求 %d/%d（%d 块）", n, len(batches), len(batch))
+        results.extend(extract_batch(batch, API_CHOICE))
+    return _collect({paper: chunks}, items, results)[paper]
+
+class ConcurrentExtractor:
+    """
+    跨论文并发调度 chunk 抽取。线程池大小即在途请求上限，
+    provider 限速在 llm_agent 真正发请求前生效；每个请求仍走 call_with_retry。
+    BATCH_CHUNKS 打开时先把相邻块（可跨论文）打包，每批一个请求。
+    """
+    def __init__(self, api_choice: str = API_CHOICE, max_in_flight: int = MAX_IN_FLIGHT):
+        self.api_choice = api_choice
+        self._pool = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="llm")
+
+    def extract(self, papers_chunks: dict[str, List[str]],
+                on_paper: Callable[[str, List[dict[str, list] | None]], None] | None = None
+                ) -> dict[str, List[dict[str, list] | None]]:
+        """
+        一次性提交所有论文的所有块（或批次），按论文、按块序收集结果，
+        与 extract_paper_serial 的输出保持一致（失败的块为 None）。
+        on_paper(paper, chunk_results) 在某篇论文的全部块完成时（于调用线程中）立即回调。
+        """
+        items = _flatten(papers_chunks)
+        batches = pack_batches(items) if BATCH_CHUNKS else [[item] for item in items]
+        futures = {self._pool.submit(extract_batch, batch, self.api_choice): i
+                   for i, batch in enumerate(batches)}
+        batch_results: List[List[dict[str, list] | None]] = [[] for _ in batches]
+        paper_batches: dict[str, List[int]] = {paper: [] for paper in papers_chunks}
+        for i, batch in enumerate(batches):
+            for paper in dict.fromkeys(p for p, _, _ in batch):
+                paper_batches[paper].append(i)
+        remaining = Counter({paper: len(idx) for paper, idx in paper_batches.items()})
+
+        def paper_results(paper: str) -> List[dict[str, list] | None]:
+            return [res for i in paper_batches[paper]
+                    for (p, _, _), res in zip(batches[i], batch_results[i])
+                    if p == paper]
+
+        if on_paper:
+            for paper in papers_chunks:
+                if not remaining[paper]:
+                    on_paper(paper, [])
+        for fut in as_completed(futures):
+            i = futures[fut]
+            batch_results[i] = fut.result()
+            for paper in dict.fromkeys(p for p, _, _ in batches[i]):
+                remaining[paper] -= 1
+                if on_paper and not remaining[paper]:
+                    on_paper(paper, paper_results(paper))
+        return {paper: paper_results(paper) for paper in papers_chunks}
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+def aggregate_datasets(chunk_results: List[dict[str, list] | None]) -> dict[str, list]:
+    """
+    合并各块结果（跳过失败的块）：同一数据集的不同写法归到同一规范名下，先出现的条目为准，缺 URL 时取后面写法的。
+    别名索引每篇新建（只含内置别名），规范名取本篇最先出现的写法，与其他论文和处理顺序无关。
+    """
     merged: dict[str, list] = {}
+    index = AliasIndex()
     for res in chunk_results:
-        for k, v in res.items():
-            merged.setdefault(k, v)
+        for k, v in (res or {}).items():
+            name = index.canonical(k)
+            if name not in merged:
+                merged[name] = v
+            elif (len(merged[name]) > 1 and merged[name][1] in _MISSING_URL
+                  and len(v) > 1 and v[1] not in _MISSING_URL):
+                merged[name][1] = v[1]
+    if scorer:
+        scorer.add_names(merged)
     return merged
 
+# ----------------------------------------------------
+#        流水线：解析 → 切块 + LLM → URL 补全
+# ----------------------------------------------------
+_STOP = object()
+
+def _start_stage(name: str, fn: Callable[[Any], Any], inbox: queue.Queue,
+                 outbox: queue.Queue | None, workers: int,
+                 on_error: Callable[[Any, Exception], None] | None = None) -> List[threading.Thread]:
+    """
+    启动一个阶段的 worker：从 inbox 取数据，处理结果放入 outbox，取到 _STOP 即退出。
+    处理失败的数据不再往下传，交给 on_error 记录，不会无声丢掉。
+    """
+    def loop():
+        while (item := inbox.get()) is not _STOP:
+            try:
+                out = fn(item)
+            except Exception as e:
+                logging.exception("[%s] 处理失败：%s", name, e)
+                if on_error is not None:
+                    on_error(item, e)
+                continue
+            if outbox is not None:
+                outbox.put(out)
+
+    threads = [threading.Thread(target=loop, name=f"{name}-{i}", daemon=True)
+               for i in range(max(workers, 1))]
+    for t in threads:
+        t.start()
+    return threads
+
+def _stop_stage(threads: List[threading.Thread], inbox: queue.Queue):
+    for _ in threads:
+        inbox.put(_STOP)
+    for t in threads:
+        t.join()
+
+def _resume_state(progress: ProgressStore | None, prior: dict[str, dict[str, list]] | None
+                  ) -> tuple[dict[str, dict[str, list]], dict[str, dict[str, list]]]:
+    """无需再处理的论文（增量模式沿用的旧结果 + 断点中已完成的）与已抽取、待补全 URL 的论文。"""
+    done = dict(prior or {})
+    if progress is None:
+        return done, {}
+    resumed = progress.papers(STAGE_DONE)
+    extracted = {p: d for p, d in progress.papers(STAGE_EXTRACTED).items() if p not in done}
+    if resumed or extracted:
+        logging.info("断点续跑：%d 篇已完成，%d 篇已抽取待补全 URL", len(resumed), len(extracted))
+    done.update(resumed)
+    return done, extracted
+
+def _incomplete_reason(full_txt: str, chunk_results: List[dict[str, list] | None]) -> str | None:
+    """抽取不完整的原因：PDF 没有解析出正文，或有块在重试后仍抽取失败；完整时返回 None。"""
+    if not full_txt.strip():
+        return "PDF 未解析出正文（解析失败、超时或为空）"
+    lost = sum(res is None for res in chunk_results)
+    if lost:
+        return f"{lost}/{len(chunk_results)} 块 LLM 抽取失败"
+    return None
+
+def _record(progress: ProgressStore | None, paper: str, datasets: dict[str, list], stage: str = STAGE_DONE):
+    if progress is not None:
+        progress.record(paper, datasets, stage)
+
+def run_pipeline(pdf_folder: str, cache_folder: str, progress: ProgressStore | None = None,
+                 prior: dict[str, dict[str, list]] | None = None,
+                 failed: dict[str, str] | None = None) -> dict[str, dict[str, list]]:
+    """
+    三个阶段各有自己的并发度，通过有界队列衔接：
+    PDF 解析（主线程 + 进程池）→ 切块与 LLM 抽取（LLM_STAGE_WORKERS）→ URL 补全（RESOLVE_STAGE_WORKERS）。
+    总耗时趋近最慢的阶段而不是三者之和。
+    给定 progress 时每篇抽取完、补全完都会落盘，已完成的论文不再解析；
+    prior 中的论文（增量模式下未变化的）直接沿用。
+    未完整处理的论文（某一阶段出错、PDF 没有正文、有块抽取失败）照常输出已得到的结果，
+    但不写入断点，并登记到 failed（论文 -> 原因），下次运行会重新处理。
+    """
+    failed = {} if failed is None else failed
+    texts_q: queue.Queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+    merged_q: queue.Queue = queue.Queue(PIPELINE_QUEUE_SIZE)
+    done, extracted = _resume_state(progress, prior)
+    results: dict[str, dict[str, list]] = dict(done)
+    results_lock = threading.Lock()
+
+    extractor = ConcurrentExtractor(API_CHOICE, MAX_IN_FLIGHT) if CONCURRENT_MODE else None
+
+    def collect(paper, datasets):
+        with results_lock:
+            results[paper] = datasets
+
+    def store(paper, datasets):
+        collect(paper, datasets)
+        if paper not in failed:
+            _record(progress, paper, datasets)
+
+    def mark_failed(paper, reason):
+        with results_lock:
+            failed[paper] = reason
+
+    def fail(item, exc):
+        paper = item[0]
+        close_harvester(paper, {})          # 释放该论文的链接索引
+        mark_failed(paper, f"{type(exc).__name__}: {exc}")
+        with results_lock:
+            results.setdefault(paper, {})
+
+    def llm_stage(item):
+        paper, full_txt = item
+        open_harvester(paper, full_txt)
+        chunks = prepare_chunks(full_txt)
+        _log_chunks(paper, chunks)
+        if extractor:
+            chunk_results = extractor.extract({paper: chunks})[paper]
+        else:
+            chunk_results = extract_paper_serial(paper, chunks)
+        merged = aggregate_datasets(chunk_results)
+        close_harvester(paper, merged)
+        reason = _incomplete_reason(full_txt, chunk_results)
+        if reason:
+            logging.warning("《%s》抽取不完整：%s，不记入断点", paper, reason)
+            mark_failed(paper, reason)
+        else:
+            _record(progress, paper, merged, STAGE_EXTRACTED)
+        return paper, merged
+
+    def resolve_stage(item):
+        paper, merged = item
+        enriched = enrich_with_urls(merged)
+        _log_enriched(paper, enriched)
+        store(paper, enriched)
+
+    # BATCH_RESOLVE 时不启动 URL 补全阶段，抽取结果直接收集，最后整批补全
+    if BATCH_RESOLVE:
+        llm_threads = _start_stage("llm", lambda item: collect(*llm_stage(item)),
+                                   texts_q, None, LLM_STAGE_WORKERS, fail)
+        resolve_threads = []
+        results.update(extracted)
+    else:
+        llm_threads = _start_stage("llm", llm_stage, texts_q, merged_q, LLM_STAGE_WORKERS, fail)
+        resolve_threads = _start_stage("resolve", resolve_stage, merged_q, None, RESOLVE_STAGE_WORKERS, fail)
+    try:
+        if not BATCH_RESOLVE:
+            for paper, merged in extracted.items():
+                merged_q.put((paper, merged))
+        for paper, full_txt in iter_pdfs_in_directory(pdf_folder, cache_folder,
+                                                      workers=PDF_WORKERS, timeout=PDF_TIMEOUT,
+                                                      cache_backend=TEXT_CACHE_BACKEND,
+                                                      skip=done.keys() | extracted.keys()):
+            texts_q.put((paper, full_txt))
+    finally:
+        _stop_stage(llm_threads, texts_q)
+        _stop_stage(resolve_threads, merged_q)
+        if extractor:
+            extractor.close()
+
+    # 按目录顺序输出，与逐篇处理、断点续跑的结果一致
+    ordered = {paper: results[paper] for paper in list_paper_names(pdf_folder) if paper in results}
+    if BATCH_RESOLVE:
+        pending = {paper: d for paper, d in ordered.items() if paper not in done}
+        enrich_all(pending)
+        for paper, enriched in pending.items():
+            _log_enriched(paper, enriched)
+            if paper not in failed:
+                _record(progress, paper, enriched)
+    return ordered
+
+def run_phased(pdf_folder: str, cache_folder: str, progress: ProgressStore | None = None,
+               prior: dict[str, dict[str, list]] | None = None,
+               failed: dict[str, str] | None = None) -> dict[str, dict[str, list]]:
+    """三阶段依次执行：先解析全部 PDF，再跑 LLM，最后逐篇补全 URL。参数（含 failed 的含义）同 run_pipeline。"""
+    failed = {} if failed is None else failed
+    done, extracted = _resume_state(progress, prior)
+    # 1) 提取 / 缓存 pdf 文本
+    papers_text = process_pdfs_in_directory(pdf_folder, cache_folder,
+                                            workers=PDF_WORKERS, timeout=PDF_TIMEOUT,
+                                            cache_backend=TEXT_CACHE_BACKEND,
+                                            skip=done.keys() | extracted.keys())
+    all_results: dict[str, dict[str, list]] = {}
+    if not papers_text and not done and not extracted:
+        return all_results
+
+    # 2) 逐篇论文切块
+    papers_chunks: dict[str, List[str]] = {}
+    for paper, full_txt in papers_text.items():
+        open_harvester(paper, full_txt)
+        chunks = prepare_chunks(full_txt)
+        _log_chunks(paper, chunks)
+        papers_chunks[paper] = chunks
+
+    # 3) LLM 抽取（并发 / 串行），每篇完成即聚合并落盘
+    merged_by_paper: dict[str, dict[str, list]] = dict(extracted)
+
+    def finish_llm(paper: str, chunk_results: List[dict[str, list] | None]):
+        merged_by_paper[paper] = merged = aggregate_datasets(chunk_results)
+        close_harvester(paper, merged)
+        reason = _incomplete_reason(papers_text[paper], chunk_results)
+        if reason:
+            logging.warning("《%s》抽取不完整：%s，不记入断点", paper, reason)
+            failed[paper] = reason
+        else:
+            _record(progress, paper, merged, STAGE_EXTRACTED)
+
+    if CONCURRENT_MODE:
+        logging.info("并发抽取 %d 块（在途上限 %d）",
+                     sum(len(c) for c in papers_chunks.values()), MAX_IN_FLIGHT)
+        extractor = ConcurrentExtractor(API_CHOICE, MAX_IN_FLIGHT)
+        try:
+            extractor.extract(papers_chunks, on_paper=finish_llm)
+        finally:
+            extractor.close()
+    else:
+        for paper, chunks in papers_chunks.items():
+            logging.info("⇨ 处理《%s》", paper)
+            finish_llm(paper, extract_paper_serial(paper, chunks))
+
+    # 4) URL 补全（整批或逐篇），按目录顺序输出
+    pending: dict[str, dict[str, list]] = {}
+    for paper in list_paper_names(pdf_folder):
+        if paper in done:
+            all_results[paper] = done[paper]
+        elif paper in merged_by_paper:
+            merged = merged_by_paper[paper]
+            all_results[paper] = pending[paper] = merged if BATCH_RESOLVE else enrich_with_urls(merged)
+            if not BATCH_RESOLVE and paper not in failed:
+                _record(progress, paper, all_results[paper])
+    if BATCH_RESOLVE:
+        enrich_all(pending)
+        for paper, enriched in pending.items():
+            if paper not in failed:
+                _record(progress, paper, enriched)
+    for paper, enriched in pending.items():
+        _log_enriched(paper, enriched)
+    return all_results
+
+# ----------------------------------------------------
+#                 增量模式：清单与旧结果
+# ----------------------------------------------------
+def pipeline_config() -> dict:
+    """影响单篇结果的配置；任何一项变化都会让旧结果与断点失效。"""
+    return {
+        "prompt_version": PROMPT_VERSION,
+        "extractor_version": EXTRACTOR_VERSION,
+        "api": API_CHOICE,
+        "model": {"paid": DEFAULT_PAID_MODEL, "free": DEFAULT_DEEPSEEK_MODEL}.get(
+            API_CHOICE, [DEFAULT_PAID_MODEL, DEFAULT_DEEPSEEK_MODEL]),
+        "chunk_tokens": MODEL_MAX_TOKENS,
+        "overlap": [CHUNK_OVERLAP_SENTENCES, CHUNK_OVERLAP_MAX_TOKENS],
+        "skip": [SKIP_REFERENCES, SKIP_BOILERPLATE],
+        "prefilter": PREFILTER_THRESHOLD if PREFILTER_ENABLED else None,
+        "batch": [BATCH_MAX_TOKENS, BATCH_MAX_CHUNKS] if BATCH_CHUNKS else None,
+    }
+
+def load_prior_results(output_path: str, manifest: RunManifest,
+                       keys: dict[str, str]) -> dict[str, dict[str, list]]:
+    """从上次的结果文件中（逐篇流式读取）取出 PDF 与配置都未变的论文。"""
+    if not os.path.exists(output_path):
+        return {}
+    prior, removed = {}, 0
+    try:
+        for paper, datasets in iter_results(output_path):
+            aliases.update(datasets)
+            if paper not in keys:
+                removed += 1
+            elif manifest.key(paper) == keys[paper]:
+                prior[paper] = datasets
+    except (OSError, ValueError) as e:
+        logging.warning("无法读取上次的结果 %s，全部重新处理：%s", output_path, e)
+        return {}
+    logging.info("增量模式：沿用 %d 篇，新增或变化 %d 篇，移除 %d 篇",
+                 len(prior), len(keys) - len(prior), removed)
+    return prior
+
+# ----------------------------------------------------
+#                    运行报告（metrics）
+# ----------------------------------------------------
+def write_metrics_report(out_dir: str):
+    """按 provider 汇总日志，并按配置写出 JSON / CSV / Prometheus 报告。"""
+    metrics = get_metrics()
+    snap = metrics.snapshot()
+    per_provider: dict[str, dict[str, float]] = {}
+    for c in snap["counters"]:
+        provider = c["labels"].get("provider")
+        if provider and c["name"].startswith("llm_") and "paper" not in c["labels"]:
+            row = per_provider.setdefault(provider, {})
+            row[c["name"]] = row.get(c["name"], 0) + c["value"]
+    for h in snap["histograms"]:
+        if h["name"] == "llm_request_seconds":
+            per_provider.setdefault(h["labels"]["provider"], {})["p95"] = h["p95"]
+    for provider, row in per_provider.items():
+        logging.info("LLM[%s]：请求 %d 次，输入 %d / 输出 %d tokens，约 $%.4f，p95 延迟 %.1f 秒",
+                     provider, row.get("llm_requests_total", 0),
+                     row.get("llm_prompt_tokens_total", 0), row.get("llm_completion_tokens_total", 0),
+                     row.get("llm_cost_usd_total", 0), row.get("p95") or 0)
+
+    for filename, write in ((METRICS_JSON_FILE, metrics.write_json),
+                            (METRICS_CSV_FILE, metrics.write_csv),
+                            (METRICS_PROMETHEUS_FILE, metrics.write_prometheus)):
+        if not filename:
+            continue
+        path = os.path.join(out_dir, filename)
+        try:
+            write(path)
+            logging.info("✔ 运行报告已写入 %s", path)
+        except Exception as e:
+            logging.error("写运行报告失败（%s）：%s", path, e)
+
 # ----------------------------------------------------
 #                        主程序
 # ----------------------------------------------------
@@ -185,48 +933,64 @@ def main():
     cache_folder = os.path.join(cwd, CACHED_TEXTS_DIR)
     output_path  = os.path.join(cwd, OUTPUT_JSON_FILE)
 
-    # 1) 提取 / 缓存 pdf 文本
-    papers_text = process_pdfs_in_directory(pdf_folder, cache_folder)
-    if not papers_text:
+    # PDF 指纹 + 配置哈希：增量模式据此判断哪些论文要重跑，断点记录据此失效
+    manifest = fingerprints = keys = None
+    prior: dict[str, dict[str, list]] = {}
+    if INCREMENTAL_MODE or CHECKPOINT_FILE:
+        manifest = RunManifest(os.path.join(cwd, MANIFEST_FILE))
+        pdf_files = list_pdf_files(pdf_folder)
+        fingerprints = manifest.fingerprints(pdf_files)
+        cfg_hash = config_hash(pipeline_config())
+        keys = {paper: f"{sha}:{cfg_hash}" for paper, sha in fingerprints.items()}
+        if INCREMENTAL_MODE:
+            prior = load_prior_results(output_path, manifest, keys)
+
+    progress = None
+    if CHECKPOINT_FILE:
+        checkpoint_path = os.path.join(cwd, CHECKPOINT_FILE)
+        if not RESUME and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        progress = ProgressStore(checkpoint_path, keys)
+    failed: dict[str, str] = {}
+    try:
+        if PIPELINE_MODE:
+            all_results = run_pipeline(pdf_folder, cache_folder, progress, prior, failed)
+        else:
+            all_results = run_phased(pdf_folder, cache_folder, progress, prior, failed)
+        if progress:
+            progress.compact()
+    finally:
+        if progress:
+            progress.close()
+    if not all_results:
         logging.error("未获取到任何论文文本，退出。")
         return
+    if failed:
+        logging.error("%d 篇论文未完整处理（未记为已完成，下次运行会重新处理）：", len(failed))
+        for paper, err in failed.items():
+            logging.error("  《%s》：%s", paper, err)
 
-    all_results: dict[str, dict[str, list]] = {}
-
-    # 2) 逐篇论文处理
-    for paper, full_txt in papers_text.items():
-        logging.info("⇨ 处理《%s》", paper)
-        chunks = split_into_chunks(full_txt, MODEL_MAX_TOKENS)
-        tot_tokens = sum(token_estimate(c) for c in chunks)
-        logging.info("  ▶ 拆成 %d 块（估计 %d tokens）", len(chunks), tot_tokens)
-
-        chunk_results = []
-        for idx, ck in enumerate(chunks, 1):
-            logging.debug("    • LLM chunk %d/%d", idx, len(chunks))
-            try:
-                res = call_with_retry(
-                    extract_datasets_from_text,
-                    f"{paper} – chunk {idx}", ck,
-                    api_choice=API_CHOICE,
-                    retries=LLM_RETRIES,
-                    initial_delay=INITIAL_DELAY,
-                    backoff=BACKOFF_FACTOR,
-                )
-                chunk_results.append(res or {})
-            except Exception as e:
-                logging.warning("      ✗ LLM 失败 chunk %d：%s", idx, e)
-
-        merged   = aggregate_datasets(chunk_results)
-        enriched = enrich_with_urls(merged)
-        ok_count = sum(1 for v in enriched.values() if v[1] != "N/A")
-        logging.info("  ▶ 识别 %d 个数据集，成功解析 URL %d 个", len(enriched), ok_count)
-        all_results[paper] = enriched
+    if scorer:
+        logging.info("预过滤：%s", scorer.summary())
+    cache = get_response_cache()
+    if cache:
+        stats = cache.stats()
+        logging.info("LLM 响应缓存：命中 %d，未命中 %d（命中率 %.0f%%）",
+                     stats["hits"], stats["misses"], 100 * stats["hit_rate"])
+    write_metrics_report(cwd)
 
-    # 3) 保存
+    # 保存
     try:
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(all_results, f, ensure_ascii=False, indent=4)
+        with ResultWriter(output_path) as writer:
+            writer.write_all(all_results.items())
         logging.info("✔ 结果已写入 %s", output_path)
+        if manifest:
+            # 只登记完整处理的论文：有块抽取失败、PDF 没有正文的不登记，下次增量运行会重新处理而不是沿用其结果
+            completed = [paper for paper in all_results if paper not in failed]
+            manifest.save(pipeline_config(), fingerprints, keys, completed)
+        # 断点只用于崩溃后续跑：结果写出成功后即删除，下次运行不会把本次结果当作断点沿用
+        if progress and os.path.exists(progress.path):
+            os.remove(progress.path)
     except Exception as e:
         logging.error("保存结果失败：%s", e)
 
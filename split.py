@@ -7,15 +7,48 @@ input_folder = "extracted_json_texts"
 before_refs_folder = "before_references"
 after_refs_folder = "after_references"
 
-# 确保输出文件夹存在
-os.makedirs(before_refs_folder, exist_ok=True)
-os.makedirs(after_refs_folder, exist_ok=True)
+# 独占一行（或独占页首/页尾）的参考文献标题，可带章节号，如 "REFERENCES"、"7 References"、"Bibliography"
+REFERENCES_HEADING = re.compile(
+    r"(?:^|(?<=\f))[ \t]*(?:\d{1,2}\.?[ \t]*|[IVX]{1,4}\.[ \t]*)?"
+    r"(?:REFERENCES|References|BIBLIOGRAPHY|Bibliography)[ \t]*(?=$|\f)",
+    re.M,
+)
 
-# 遍历输入文件夹中的所有 JSON 文件
-for filename in os.listdir(input_folder):
-    if filename.endswith(".json"):
+
+def find_references_heading(text):
+    """返回最后一个独占一行的参考文献标题的匹配对象，没有则返回 None。"""
+    last = None
+    for last in REFERENCES_HEADING.finditer(text):
+        pass
+    return last
+
+
+def split_references(text):
+    """
+    按参考文献标题把全文分成 (正文, 参考文献及其后内容)，找不到时后者为空串。
+    优先使用独占一行的标题；否则退回按首个 'REFERENCES'，再按首个 'References' 分割。
+    """
+    m = find_references_heading(text)
+    if m:
+        return text[:m.start()], text[m.end():]
+    for references_pattern in (r'REFERENCES', r'References'):
+        split_result = re.split(references_pattern, text, maxsplit=1)
+        if len(split_result) > 1:
+            return split_result[0], split_result[1]
+    return text, ''
+
+
+def main():
+    # 确保输出文件夹存在
+    os.makedirs(before_refs_folder, exist_ok=True)
+    os.makedirs(after_refs_folder, exist_ok=True)
+
+    # 遍历输入文件夹中的所有 JSON 文件
+    for filename in os.listdir(input_folder):
+        if not filename.endswith(".json"):
+            continue
         input_filepath = os.path.join(input_folder, filename)
-        
+
         # 读取 JSON 文件
         try:
             with open(input_filepath, 'r', encoding='utf-8', newline='') as f:
@@ -23,44 +56,27 @@ for filename in os.listdir(input_folder):
         except Exception as e:
             print(f"Error reading {filename}: {e}")
             continue
-        
+
         # 检查 text 字段
         text = data.get('text', '')
         if not text:
             print(f"Warning: Empty text field in {filename}")
             continue
-        
+
         # 规范化换行符
         text = text.replace('\r\n', '\n').replace('\r', '\n')
-        
-        # 初始化分割结果
-        before_references = text
-        after_references = ''
-        
-        # 首先尝试使用 REFERENCES 分割
-        references_pattern = r'REFERENCES'
-        split_result = re.split(references_pattern, text, maxsplit=1)
-        
-        if len(split_result) > 1:
-            # 成功使用 REFERENCES 分割
-            before_references = split_result[0]
-            after_references = split_result[1]
-            print(f"Split {filename} using 'REFERENCES'")
+
+        # 分割参考文献
+        before_references, after_references = split_references(text)
+        if after_references:
+            print(f"Split {filename} at references heading")
         else:
-            # 未找到 REFERENCES，尝试使用 References 分割
-            references_pattern = r'References'
-            split_result = re.split(references_pattern, text, maxsplit=1)
-            if len(split_result) > 1:
-                before_references = split_result[0]
-                after_references = split_result[1]
-                print(f"Split {filename} using 'References'")
-            else:
-                print(f"No 'REFERENCES' or 'References' found in {filename}, saving entire text as before_references")
-        
+            print(f"No 'REFERENCES' or 'References' found in {filename}, saving entire text as before_references")
+
         # 如果 after_references 为空，记录警告
         if not after_references.strip():
             print(f"Warning: No content after References in {filename}")
-        
+
         # 准备保存的 JSON 数据
         before_json = {
             "paper_name": data.get('paper_name', ''),
@@ -70,18 +86,18 @@ for filename in os.listdir(input_folder):
             "paper_name": data.get('paper_name', ''),
             "text": after_references.strip()
         }
-        
+
         # 定义输出文件路径
         base_filename = os.path.splitext(filename)[0]
         before_output_filepath = os.path.join(before_refs_folder, f"{base_filename}.json")
         after_output_filepath = os.path.join(after_refs_folder, f"{base_filename}.json")
-        
+
         # 保存文件
         try:
             with open(before_output_filepath, 'w', encoding='utf-8') as f:
                 json.dump(before_json, f, ensure_ascii=False, indent=4)
             print(f"Saved before_references to {before_output_filepath}")
-            
+
             # 仅当 after_references 非空时保存
             if after_references.strip():
                 with open(after_output_filepath, 'w', encoding='utf-8') as f:
@@ -90,4 +106,8 @@ for filename in os.listdir(input_folder):
         except Exception as e:
             print(f"Error saving files for {filename}: {e}")
 
-print("JSON 文件分割完成！")
\ No newline at end of file
+    print("JSON 文件分割完成！")
+
+
+if __name__ == "__main__":
+    main()
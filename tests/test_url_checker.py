@@ -0,0 +1,184 @@
+"""
+UrlChecker / check.check_batch 的场景测试：在本地起一个桩 HTTP 服务，不访问外网
+（DNS 失败用保留的 .invalid 域名）。运行：python -m pytest -q tests 或 python -m unittest discover tests
+"""
+import os
+import sys
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import check
+from url_checker import UrlChecker, UrlStatusCache
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """
+    /ok            200
+    /redir         302 -> /final（200）
+    /loop          302 -> /loop2 -> /loop
+    /nohead        HEAD 返回 405，GET 返回 200
+    /unavailable   503
+    /missing       404
+    /slow?...      200，响应前等待 SLOW_SECONDS，记录同时在途的请求数
+    """
+    SLOW_SECONDS = 0.2
+
+    def _route(self):
+        server = self.server
+        path = self.path.split("?", 1)[0]
+        with server.lock:
+            server.hits[(self.command, path)] += 1
+        if path in ("/ok", "/final"):
+            return self._reply(200)
+        if path == "/redir":
+            return self._reply(302, "/final")
+        if path == "/loop":
+            return self._reply(302, "/loop2")
+        if path == "/loop2":
+            return self._reply(302, "/loop")
+        if path == "/nohead":
+            return self._reply(405 if self.command == "HEAD" else 200)
+        if path == "/unavailable":
+            return self._reply(503)
+        if path == "/slow":
+            with server.lock:
+                server.in_flight += 1
+                server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            time.sleep(self.SLOW_SECONDS)
+            with server.lock:
+                server.in_flight -= 1
+            return self._reply(200)
+        return self._reply(404)
+
+    def _reply(self, status, location=None):
+        self.send_response(status)
+        if location:
+            self.send_header("Location", location)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    do_HEAD = do_GET = _route
+
+    def log_message(self, format, *args):
+        pass
+
+
+class UrlCheckerTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+        cls.server.daemon_threads = True
+        cls.server.lock = threading.Lock()
+        cls.server.hits = Counter()
+        cls.server.in_flight = cls.server.max_in_flight = 0
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.hits.clear()
+        self.server.in_flight = self.server.max_in_flight = 0
+        self.tmp = tempfile.mkdtemp()
+        self.cache = UrlStatusCache(os.path.join(self.tmp, "cache.sqlite"))
+        self.checker = UrlChecker(self.cache, workers=8, per_host=2, timeout=(2, 5), retries=0)
+
+    def tearDown(self):
+        self.checker.close()
+        self.cache.close()
+        shutil.rmtree(self.tmp, ignore_errors=True)
+
+    def url(self, path):
+        return self.base + path
+
+    def test_ok(self):
+        status = self.checker.check(self.url("/ok"))
+        self.assertIs(status.ok, True)
+        self.assertEqual(status.status, 200)
+        self.assertEqual(status.final_url, self.url("/ok"))
+
+    def test_redirect_records_final_url(self):
+        status = self.checker.check(self.url("/redir"))
+        self.assertIs(status.ok, True)
+        self.assertEqual(status.final_url, self.url("/final"))
+
+    def test_redirect_loop_is_dead(self):
+        status = self.checker.check(self.url("/loop"))
+        self.assertIs(status.ok, False)
+        self.assertEqual(status.error, "redirect loop")
+
+    def test_head_405_falls_back_to_get(self):
+        status = self.checker.check(self.url("/nohead"))
+        self.assertIs(status.ok, True)
+        self.assertEqual(self.server.hits[("HEAD", "/nohead")], 1)
+        self.assertEqual(self.server.hits[("GET", "/nohead")], 1)
+
+    def test_404_is_dead(self):
+        status = self.checker.check(self.url("/missing"))
+        self.assertIs(status.ok, False)
+        self.assertEqual(status.status, 404)
+
+    def test_503_is_inconclusive_and_retried(self):
+        checker = UrlChecker(None, retries=1, timeout=(2, 5))
+        try:
+            status = checker.check(self.url("/unavailable"))
+        finally:
+            checker.close()
+        self.assertIsNone(status.ok)
+        self.assertEqual(status.status, 503)
+        self.assertEqual(self.server.hits[("HEAD", "/unavailable")], 2)
+
+    def test_dns_failure_is_dead(self):
+        status = self.checker.check("http://no-such-host.invalid/")
+        self.assertIs(status.ok, False)
+        self.assertEqual(status.error, "DNS resolution failed")
+
+    def test_per_host_cap(self):
+        urls = [self.url(f"/slow?i={i}") for i in range(8)]
+        results = self.checker.check_many(urls)
+        self.assertTrue(all(results[u].ok for u in urls))
+        self.assertLessEqual(self.server.max_in_flight, 2)
+        self.assertGreaterEqual(self.server.max_in_flight, 1)
+
+    def test_check_many_dedups_and_caches(self):
+        urls = [self.url("/ok"), self.url("/ok"), self.url("/missing"), self.url("/unavailable")]
+        first = self.checker.check_many(urls)
+        self.assertEqual(self.server.hits[("HEAD", "/ok")], 1)
+        self.assertFalse(any(s.cached for s in first.values()))
+
+        second = self.checker.check_many(urls)
+        self.assertTrue(second[self.url("/ok")].cached)
+        self.assertTrue(second[self.url("/missing")].cached)
+        # 不确定的结果不缓存，下次重新检查
+        self.assertFalse(second[self.url("/unavailable")].cached)
+        self.assertEqual(self.server.hits[("HEAD", "/ok")], 1)
+        self.assertEqual(self.server.hits[("HEAD", "/unavailable")], 2)
+
+    def test_check_batch_keeps_inconclusive_urls_valid(self):
+        datasets = {
+            "A": ["A", self.url("/redir")],
+            "B": ["B", self.url("/unavailable")],
+            "C": ["C", self.url("/loop")],
+            "D": ["D", "http://no-such-host.invalid/data"],
+        }
+        valid, invalid = check.classify_paper(datasets)
+        check.check_batch([("paper", valid, invalid)], self.checker)
+        self.assertEqual(valid["A"][1], self.url("/final"))
+        self.assertEqual(valid["B"][1], self.url("/unavailable"))
+        self.assertEqual(sorted(invalid), ["C", "D"])
+
+
+if __name__ == "__main__":
+    unittest.main()
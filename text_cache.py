@@ -0,0 +1,120 @@
+import os
+import sys
+import time
+import zlib
+import sqlite3
+import hashlib
+import argparse
+from contextlib import closing
+
+TEXT_CACHE_DB = "text_cache.sqlite"
+_HASH_BLOCK = 1 << 20
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class TextCache:
+    """
+    按内容哈希寻址的 PDF 文本缓存（SQLite，文本 zlib 压缩存储）。
+
+    - files 表记录 路径 -> (size, mtime, sha256)，size/mtime 未变时直接复用哈希，
+      变化时才重新计算，因此热启动不需要读 PDF 内容；
+    - texts 表以 (sha256, extractor_version) 为主键，替换同名 PDF 或升级抽取器都会自然失效。
+    """
+
+    def __init__(self, db: str, extractor_version: str):
+        self.conn = sqlite3.connect(db)
+        self.extractor_version = extractor_version
+        self._ensure()
+
+    def _ensure(self):
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            "path TEXT PRIMARY KEY, size INTEGER, mtime REAL, sha256 TEXT, ts REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS texts ("
+            "sha256 TEXT, version TEXT, paper_name TEXT, text BLOB, ts REAL, "
+            "PRIMARY KEY (sha256, version))"
+        )
+        self.conn.commit()
+
+    def fingerprint(self, pdf_path: str) -> str:
+        """返回 PDF 的内容哈希；size 与 mtime 都未变时直接用记录值。"""
+        path = os.path.abspath(pdf_path)
+        st = os.stat(path)
+        row = self.conn.execute(
+            "SELECT size, mtime, sha256 FROM files WHERE path=?", (path,)
+        ).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime:
+            return row[2]
+        sha = file_sha256(path)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO files(path, size, mtime, sha256, ts) VALUES(?,?,?,?,?)",
+            (path, st.st_size, st.st_mtime, sha, time.time()),
+        )
+        self.conn.commit()
+        return sha
+
+    def get(self, paper_name: str, pdf_path: str) -> str | None:
+        row = self.conn.execute(
+            "SELECT text FROM texts WHERE sha256=? AND version=?",
+            (self.fingerprint(pdf_path), self.extractor_version),
+        ).fetchone()
+        return zlib.decompress(row[0]).decode("utf-8") if row else None
+
+    def put(self, paper_name: str, pdf_path: str, text: str):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO texts(sha256, version, paper_name, text, ts) VALUES(?,?,?,?,?)",
+            (self.fingerprint(pdf_path), self.extractor_version, paper_name,
+             zlib.compress(text.encode("utf-8")), time.time()),
+        )
+        self.conn.commit()
+
+    def prune(self) -> tuple[int, int]:
+        """
+        删除孤儿条目：指向已不存在文件的 files 记录，
+        以及不再被任何文件引用或抽取器版本过期的 texts 记录。
+        返回 (删除的文件记录数, 删除的文本记录数)。
+        """
+        paths = [row[0] for row in self.conn.execute("SELECT path FROM files")]
+        gone = [(p,) for p in paths if not os.path.exists(p)]
+        with self.conn:
+            self.conn.executemany("DELETE FROM files WHERE path=?", gone)
+            cur = self.conn.execute(
+                "DELETE FROM texts WHERE version<>? OR sha256 NOT IN (SELECT sha256 FROM files)",
+                (self.extractor_version,),
+            )
+        self.conn.execute("VACUUM")
+        return len(gone), cur.rowcount
+
+    def close(self):
+        self.conn.close()
+
+
+def main(argv=None):
+    from pdf_parser import EXTRACTOR_VERSION
+
+    parser = argparse.ArgumentParser(description="PDF 文本缓存维护")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_prune = sub.add_parser("prune", help="清理已删除 PDF 与过期抽取器版本的缓存条目")
+    p_prune.add_argument("db", nargs="?", default=os.path.join("extract", TEXT_CACHE_DB))
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.db):
+        print(f"错误：缓存数据库 '{args.db}' 不存在。")
+        return 1
+    with closing(TextCache(args.db, EXTRACTOR_VERSION)) as cache:
+        files_removed, texts_removed = cache.prune()
+    print(f"已清理 {files_removed} 条文件记录、{texts_removed} 条文本记录。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
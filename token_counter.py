@@ -0,0 +1,157 @@
+import os
+import re
+import math
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+try:
+    import tiktoken
+    from tiktoken.load import load_tiktoken_bpe
+except ImportError:  # 未安装 tiktoken 时退回离线估计
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+TOKENIZER_ENCODING = "cl100k_base"
+# 本地 BPE 词表（.tiktoken 文件）；存在时离线构建编码器，不需要联网下载
+TOKENIZER_VOCAB_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                    "vocab", f"{TOKENIZER_ENCODING}.tiktoken")
+_CACHE_SIZE = 65536
+# 假名、CJK 统一表意文字（含扩展 A）、谚文、兼容表意文字
+_CJK_RANGES = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+
+# cl100k_base 的预分词规则
+_CL100K_PAT = (r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n]*|"""
+               r"""\s*[\r\n]+|\s+(?!\S)|\s+""")
+_CL100K_SPECIAL = {"<|endoftext|>": 100257, "<|fim_prefix|>": 100258, "<|fim_middle|>": 100259,
+                   "<|fim_suffix|>": 100260, "<|endofprompt|>": 100276}
+
+
+class TokenCounter(ABC):
+    """
+    token 计数器基类：子类实现 _count，线程安全。
+    按文本内容的摘要做 LRU 缓存（不保存文本本身），缓存占用只与条目数有关，与块 / prompt 的长度无关。
+    """
+
+    name = "base"
+
+    def __init__(self, cache_size: int = _CACHE_SIZE):
+        self._cache: OrderedDict[bytes, int] = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def _count(self, text: str) -> int:
+        ...
+
+    @staticmethod
+    def _key(text: str) -> bytes:
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def count(self, text: str) -> int:
+        key = self._key(text)
+        with self._lock:
+            n = self._cache.get(key)
+            if n is not None:
+                self._cache.move_to_end(key)
+                return n
+        n = self._count(text)
+        with self._lock:
+            self._cache[key] = n
+            self._cache.move_to_end(key)
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+        return n
+
+
+class TiktokenCounter(TokenCounter):
+    """基于 tiktoken 的精确计数；优先从本地词表文件离线加载。"""
+
+    name = "tiktoken"
+
+    def __init__(self, encoding: str = TOKENIZER_ENCODING, vocab_file: str = TOKENIZER_VOCAB_FILE, **kw):
+        super().__init__(**kw)
+        if encoding == "cl100k_base" and os.path.exists(vocab_file):
+            self._enc = tiktoken.Encoding(
+                name=encoding,
+                pat_str=_CL100K_PAT,
+                mergeable_ranks=load_tiktoken_bpe(vocab_file),
+                special_tokens=_CL100K_SPECIAL,
+            )
+        else:
+            logger.warning("本地词表 %s 不存在，tiktoken 将联网下载 %s 词表", vocab_file, encoding)
+            self._enc = tiktoken.get_encoding(encoding)
+
+    def _count(self, text: str) -> int:
+        return len(self._enc.encode(text, disallowed_special=()))
+
+
+class HeuristicCounter(TokenCounter):
+    """
+    无依赖的离线估计：按与 BPE 预分词相近的规则切片，再逐片估算。
+    CJK 每字约 1 token；数字每 3 位 1 token；常见长度的单词 1 token、更长的约 5 字符 1 token；
+    标点符号串约 2 字符 1 token（URL、公式会被切成多片，因此不会被低估）。
+    """
+
+    name = "heuristic"
+
+    _pieces = re.compile(
+        rf"(?P<cjk>[{_CJK_RANGES}]+)"
+        rf"|(?P<word>[^\W\d_{_CJK_RANGES}]+)"
+        r"|(?P<num>\d+)"
+        r"|(?P<punct>[^\w\s]+|_+)"
+        r"|(?P<newline>\n+)"
+    )
+
+    def _count(self, text: str) -> int:
+        n = 0
+        for m in self._pieces.finditer(text):
+            piece = m.group()
+            kind = m.lastgroup
+            if kind == "cjk":
+                n += len(piece)
+            elif kind == "word":
+                n += max(1, math.ceil((len(piece) - 2) / 5))
+            elif kind == "num":
+                n += math.ceil(len(piece) / 3)
+            elif kind == "punct":
+                n += math.ceil(len(piece) / 2)
+            else:
+                n += 1
+        return n
+
+
+_counter: TokenCounter | None = None
+_counter_lock = threading.Lock()
+
+
+def set_token_counter(counter: TokenCounter):
+    """替换全局计数器（例如换成目标模型对应的编码）。"""
+    global _counter
+    with _counter_lock:
+        _counter = counter
+
+
+def get_token_counter() -> TokenCounter:
+    """全局计数器：装了 tiktoken 时用精确计数，否则用离线估计（首次选定时告警一次，块大小不再精确）。"""
+    global _counter
+    with _counter_lock:
+        if _counter is None:
+            if tiktoken is None:
+                logger.warning("未安装 tiktoken，token 数改用离线估计，切块大小不精确（pip install tiktoken，"
+                               "并把 %s 词表放到 %s 可离线精确计数）", TOKENIZER_ENCODING, TOKENIZER_VOCAB_FILE)
+                _counter = HeuristicCounter()
+            else:
+                try:
+                    _counter = TiktokenCounter()
+                except Exception as e:  # 词表无法加载（离线且无本地文件）
+                    logger.warning("tiktoken 词表加载失败，token 数改用离线估计，切块大小不精确：%s", e)
+                    _counter = HeuristicCounter()
+        return _counter
+
+
+def count_tokens(text: str) -> int:
+    return get_token_counter().count(text)
@@ -0,0 +1,210 @@
+import time
+import sqlite3
+import logging
+import threading
+import urllib.parse
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+OK_TTL = 7 * 24 * 3600        # 可达 URL 的检查结果有效期
+DEAD_TTL = 24 * 3600          # 确认失效（4xx、DNS 解析失败等）的有效期；超时、5xx 等临时错误不缓存
+MAX_WORKERS = 64              # 同时在途的请求数（也是连接池大小）
+PER_HOST_LIMIT = 4            # 同一主机同时在途的请求数
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+MAX_REDIRECTS = 5
+TRANSIENT_RETRIES = 1         # 临时错误的重试次数
+USER_AGENT = "Mozilla/5.0 (compatible; dataset-url-checker)"
+
+# 这些状态码下改用 GET 再试一次：部分站点不支持或拒绝 HEAD
+_HEAD_FALLBACK = {400, 403, 404, 405, 406, 501}
+_REDIRECTS = {301, 302, 303, 307, 308}
+# 域名解析失败的异常信息（各平台 / urllib3 版本写法不同），视为确认失效而非临时错误
+_DNS_FAILURE_HINTS = ("NameResolutionError", "Name or service not known", "nodename nor servname",
+                      "getaddrinfo failed", "No address associated with hostname")
+
+
+def _host(url: str) -> str:
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+class UrlStatus:
+    """一次检查的结果：ok 为 None 表示临时错误（超时、5xx、429 等），结果不确定。"""
+    __slots__ = ("url", "ok", "status", "final_url", "error", "cached")
+
+    def __init__(self, url: str, ok: bool | None, status: int | None = None,
+                 final_url: str | None = None, error: str | None = None, cached: bool = False):
+        self.url = url
+        self.ok = ok
+        self.status = status
+        self.final_url = final_url or url
+        self.error = error
+        self.cached = cached
+
+    def __repr__(self):
+        return f"UrlStatus({self.url!r}, ok={self.ok}, status={self.status}, final_url={self.final_url!r})"
+
+
+class UrlStatusCache:
+    """URL 检查结果的 SQLite 缓存（可与 DatasetResolver 共用同一个数据库文件，表名不同）。"""
+
+    def __init__(self, db: str = "dataset_cache.sqlite", ok_ttl: float = OK_TTL, dead_ttl: float = DEAD_TTL):
+        self.conn = sqlite3.connect(db, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.ok_ttl = ok_ttl
+        self.dead_ttl = dead_ttl
+        with self._lock, self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS url_status ("
+                "url TEXT PRIMARY KEY, ok INTEGER, status INTEGER, final_url TEXT, error TEXT, ts REAL)"
+            )
+
+    def get_many(self, urls: list[str], batch: int = 500) -> dict[str, UrlStatus]:
+        """未过期的缓存结果。"""
+        now = time.time()
+        out = {}
+        with self._lock:
+            for i in range(0, len(urls), batch):
+                part = urls[i:i + batch]
+                cur = self.conn.execute(
+                    "SELECT url, ok, status, final_url, error, ts FROM url_status "
+                    f"WHERE url IN ({','.join('?' * len(part))})", part
+                )
+                for url, ok, status, final_url, error, ts in cur:
+                    if now - ts <= (self.ok_ttl if ok else self.dead_ttl):
+                        out[url] = UrlStatus(url, bool(ok), status, final_url, error, cached=True)
+        return out
+
+    def save_many(self, results: Iterable[UrlStatus]):
+        """单个事务写回；结果不确定（ok 为 None）的不写。"""
+        now = time.time()
+        rows = [(r.url, int(r.ok), r.status, r.final_url, r.error, now) for r in results if r.ok is not None]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO url_status(url, ok, status, final_url, error, ts) VALUES(?,?,?,?,?,?)",
+                rows,
+            )
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+class UrlChecker:
+    """
+    并发检查 URL 是否可达：共享连接池，按主机限制并发，逐跳跟随重定向并记录最终（规范）URL。
+    先发 HEAD，站点不支持时改发 GET（只读响应头，不下载正文）。
+    同一批 URL 先去重、查缓存，剩下的按主机轮流排队，避免大量请求堆在同一主机的信号量上。
+    """
+
+    def __init__(self, cache: UrlStatusCache | None = None, workers: int = MAX_WORKERS,
+                 per_host: int = PER_HOST_LIMIT, timeout: tuple[float, float] = (CONNECT_TIMEOUT, READ_TIMEOUT),
+                 max_redirects: int = MAX_REDIRECTS, retries: int = TRANSIENT_RETRIES):
+        self.cache = cache
+        self.workers = max(workers, 1)
+        self.per_host = max(per_host, 1)
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.retries = retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.per_host, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": USER_AGENT})
+        self._host_slots: dict[str, threading.BoundedSemaphore] = {}
+        self._slots_lock = threading.Lock()
+
+    def _slot(self, host: str) -> threading.BoundedSemaphore:
+        with self._slots_lock:
+            slot = self._host_slots.get(host)
+            if slot is None:
+                slot = self._host_slots[host] = threading.BoundedSemaphore(self.per_host)
+            return slot
+
+    def _request(self, url: str) -> requests.Response:
+        """对单个 URL 发一次请求（不跟随重定向），占用该主机的一个并发名额。"""
+        with self._slot(_host(url)):
+            r = self.session.head(url, allow_redirects=False, timeout=self.timeout)
+            r.close()
+            if r.status_code in _HEAD_FALLBACK:
+                r = self.session.get(url, allow_redirects=False, timeout=self.timeout, stream=True)
+                r.close()
+            return r
+
+    def _check_once(self, url: str) -> UrlStatus:
+        current, seen = url, {url}
+        for _ in range(self.max_redirects + 1):
+            try:
+                r = self._request(current)
+            except requests.exceptions.ConnectionError as e:
+                if any(hint in str(e) for hint in _DNS_FAILURE_HINTS):
+                    return UrlStatus(url, False, None, current, "DNS resolution failed")
+                # 连接被拒、重置等可能是暂时的，交由重试与下次运行判断
+                return UrlStatus(url, None, None, current, type(e).__name__)
+            except requests.exceptions.Timeout as e:
+                return UrlStatus(url, None, None, current, type(e).__name__)
+            except requests.exceptions.RequestException as e:
+                return UrlStatus(url, False, None, current, type(e).__name__)
+            status = r.status_code
+            if status in _REDIRECTS and r.headers.get("Location"):
+                current = urllib.parse.urljoin(current, r.headers["Location"])
+                if current in seen:
+                    return UrlStatus(url, False, status, current, "redirect loop")
+                seen.add(current)
+                continue
+            if status == 429 or status >= 500:
+                return UrlStatus(url, None, status, current, f"HTTP {status}")
+            ok = 200 <= status < 400
+            return UrlStatus(url, ok, status, current, None if ok else f"HTTP {status}")
+        return UrlStatus(url, False, None, current, "too many redirects")
+
+    def check(self, url: str) -> UrlStatus:
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            result = self._check_once(url)
+            if result.ok is not None or attempt == self.retries:
+                break
+            time.sleep(0.5 * (attempt + 1))
+        metrics = get_metrics()
+        metrics.observe("url_check_seconds", time.perf_counter() - start)
+        outcome = {True: "ok", False: "dead", None: "error"}[result.ok]
+        metrics.inc("url_check_total", outcome=outcome)
+        return result
+
+    def check_many(self, urls: Iterable[str]) -> dict[str, UrlStatus]:
+        """批量检查：去重 → 查缓存 → 按主机轮流并发检查 → 单个事务写回缓存。返回 {url: UrlStatus}。"""
+        unique = list(dict.fromkeys(u for u in urls if u))
+        found = self.cache.get_many(unique) if self.cache else {}
+        get_metrics().inc("url_check_cached_total", len(found))
+        todo = [u for u in unique if u not in found]
+        if not todo:
+            return found
+
+        by_host: dict[str, deque] = defaultdict(deque)
+        for u in todo:
+            by_host[_host(u)].append(u)
+        ordered = []
+        while by_host:
+            for host in list(by_host):
+                ordered.append(by_host[host].popleft())
+                if not by_host[host]:
+                    del by_host[host]
+
+        logger.info("检查 %d 个 URL（缓存命中 %d 个，需联网 %d 个）", len(unique), len(found), len(todo))
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(ordered)), thread_name_prefix="url-check") as pool:
+            checked = dict(zip(ordered, pool.map(self.check, ordered)))
+        if self.cache:
+            self.cache.save_many(checked.values())
+        found.update(checked)
+        return found
+
+    def close(self):
+        self.session.close()
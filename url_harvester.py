@@ -0,0 +1,198 @@
+import re
+import bisect
+from difflib import SequenceMatcher
+from typing import Iterable
+
+# 链接：带协议或 www. 开头的，以及不带协议的常见数据托管平台；
+# PDF 抽取常把长链接在 "/"、"-"、"_" 后断行，这种情况下接上下一行继续匹配
+_URL_PAT = re.compile(
+    r"""(?:https?://|www\.|\b(?:github\.com|huggingface\.co|kaggle\.com|zenodo\.org|figshare\.com)/)
+        [^\s<>"'{}\[\]]+
+        (?:(?<=[/\-_])\n[^\s<>"'{}\[\]]+)*""",
+    re.IGNORECASE | re.VERBOSE,
+)
+_TRAILING = ".,;:!?'\""
+# 指向论文本身而非数据集的站点
+_PAPER_HOSTS = ("arxiv.org", "doi.org", "openreview.net", "aclanthology.org", "aclweb.org",
+                "dl.acm.org", "ieeexplore.ieee.org", "proceedings.neurips.cc", "papers.nips.cc",
+                "proceedings.mlr.press", "openaccess.thecvf.com", "creativecommons.org", "scholar.google")
+# 通用托管站点的主机名本身不代表某个数据集
+_GENERIC_HOST_LABELS = {"github", "gitlab", "huggingface", "kaggle", "zenodo", "figshare", "drive", "docs",
+                        "sites", "storage", "dl", "data", "bitbucket", "osf", "dropbox", "codalab"}
+# 代码仓库：邻近的仓库链接多是论文代码而非数据集，只接受名称相似的匹配
+_CODE_HOSTS = ("github.com", "gitlab.com", "bitbucket.org")
+_DIGITS = re.compile(r"\d+")
+_HOST_PAT = re.compile(r"^(?:https?://)?(?:www\.)?([^/:?#]+)", re.IGNORECASE)
+_SEGMENT_SPLIT = re.compile(r"[/?#=&.]+")
+
+SIM_THRESHOLD = 0.8        # 名称与链接路径片段的相似度达到此值即认定匹配
+PROXIMITY_WINDOW = 200     # 名称出现处与链接之间的最大字符距离（用于按邻近度匹配）
+_MIN_NAME_CHARS = 3
+
+
+def _norm(s: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "", s.lower())
+
+
+def _similarity(key: str, seg: str) -> float:
+    """规范化的名称与链接片段的相似度；数字部分不同的视为不同数据集（CIFAR-10 与 CIFAR-100）。"""
+    if key == seg:
+        return 1.0
+    if _DIGITS.findall(key) != _DIGITS.findall(seg):
+        return 0.0
+    if len(key) >= 4 and seg.startswith(key) and not seg[len(key)].isdigit():   # 如 coco -> cocodataset
+        return 0.85
+    return SequenceMatcher(None, key, seg).ratio()
+
+
+def _stem(key: str) -> str:
+    """去掉数字后的名称主干，如 cifar10 -> cifar。"""
+    return _DIGITS.sub("", key)
+
+
+def _clean(url: str) -> str:
+    url = url.replace("\n", "").rstrip(_TRAILING)
+    while url.endswith(")") and url.count("(") < url.count(")"):
+        url = url[:-1].rstrip(_TRAILING)
+    if not url.lower().startswith(("http://", "https://")):
+        url = "https://" + url
+    return url
+
+
+class UrlMention:
+    __slots__ = ("url", "start", "end", "host", "segments")
+
+    def __init__(self, url: str, start: int, end: int):
+        self.url = url
+        self.start = start
+        self.end = end
+        m = _HOST_PAT.match(url)
+        self.host = m.group(1).lower() if m else ""
+        # 用于与数据集名比较的片段：主机名首段（如 cocodataset）与路径各段
+        path = url[m.end():] if m else url
+        self.segments = {_norm(seg) for seg in _SEGMENT_SPLIT.split(path) if seg}
+        host_label = self.host.split(".")[0]
+        if host_label not in _GENERIC_HOST_LABELS:
+            self.segments.add(_norm(host_label))
+        self.segments.discard("")
+
+    @property
+    def is_code_repo(self) -> bool:
+        return any(self.host == h or self.host.endswith("." + h) for h in _CODE_HOSTS)
+
+    def mentions_any(self, names: Iterable[str]) -> bool:
+        """链接片段中是否含有这些名称的主干（如 cifar-100-python 含 cifar）。"""
+        for name in names:
+            stem = _stem(_norm(name))
+            if len(stem) >= _MIN_NAME_CHARS and any(stem in seg for seg in self.segments):
+                return True
+        return False
+
+    def distance(self, start: int, end: int) -> int:
+        """与文本区间 [start, end) 之间的字符距离，重叠为 0。"""
+        if self.end <= start:
+            return start - self.end
+        if self.start >= end:
+            return self.start - end
+        return 0
+
+
+def harvest_urls(text: str) -> list[UrlMention]:
+    """抽出全文中所有（非论文站点的）链接及其位置，按出现顺序排列。"""
+    mentions = []
+    for m in _URL_PAT.finditer(text):
+        url = _clean(m.group())
+        mention = UrlMention(url, m.start(), m.end())
+        if any(mention.host == h or mention.host.endswith("." + h) or mention.host.startswith(h + ".")
+               for h in _PAPER_HOSTS):
+            continue
+        mentions.append(mention)
+    return mentions
+
+
+class UrlHarvester:
+    """
+    基于论文全文（含参考文献与脚注）的本地 URL 补全，不联网。
+
+    先用正则抽出所有链接及位置，按起始位置建索引；给数据集名找链接时，
+    优先取路径片段与名称模糊相似（且数字一致）的链接；其次取与名称出现处相距不超过 PROXIMITY_WINDOW、
+    互为最近（链接最近的名称也是它）的链接，但代码仓库链接、以及片段中含有任一数据集名主干的链接
+    （多半属于别的数据集或同名的其他版本）不按邻近度匹配。
+    """
+
+    def __init__(self, text: str):
+        self.text = text or ""
+        self.mentions = harvest_urls(self.text)
+        self._starts = [m.start for m in self.mentions]
+
+    def _occurrences(self, name: str) -> list[tuple[int, int]]:
+        """名称在全文中各处出现的区间。"""
+        tokens = re.findall(r"[A-Za-z0-9]+", name)
+        if not tokens or len("".join(tokens)) < _MIN_NAME_CHARS:
+            return []
+        pat = r"(?<![A-Za-z0-9])" + r"[\s\-_]*".join(map(re.escape, tokens)) + r"(?![A-Za-z0-9])"
+        return [m.span() for m in re.finditer(pat, self.text, re.IGNORECASE)]
+
+    def _neighbors(self, start: int, end: int) -> list[tuple[int, UrlMention]]:
+        """区间前后相邻的链接（二分查找）及距离，按距离从近到远。"""
+        i = bisect.bisect_right(self._starts, start)
+        out = [(self.mentions[j].distance(start, end), self.mentions[j])
+               for j in (i - 1, i) if 0 <= j < len(self.mentions)]
+        return sorted(out, key=lambda x: x[0])
+
+    def _by_similarity(self, name: str) -> str | None:
+        key = _norm(name)
+        if len(key) < _MIN_NAME_CHARS:
+            return None
+        best, best_sim = None, 0.0
+        for m in self.mentions:
+            for seg in m.segments:
+                sim = _similarity(key, seg)
+                if sim > best_sim:
+                    best, best_sim = m, sim
+        return best.url if best and best_sim >= SIM_THRESHOLD else None
+
+    def _by_proximity(self, name: str, occurrences: dict[str, list[tuple[int, int]]]) -> str | None:
+        for start, end in occurrences.get(name, ()):
+            for d, mention in self._neighbors(start, end):
+                if d > PROXIMITY_WINDOW:
+                    break
+                if mention.is_code_repo or mention.mentions_any(occurrences):
+                    continue
+                # 互为最近：离这个链接最近的名称出现处必须属于当前名称
+                nearest_name = min(
+                    ((other, mention.distance(*span)) for other, spans in occurrences.items() for span in spans),
+                    key=lambda x: x[1],
+                )[0]
+                if nearest_name == name:
+                    return mention.url
+        return None
+
+    def find(self, name: str, others: Iterable[str] = ()) -> str | None:
+        """为单个数据集名找链接；others 为同一论文中的其他数据集名，用于邻近匹配时的互斥判断。"""
+        if not self.mentions:
+            return None
+        url = self._by_similarity(name)
+        if url:
+            return url
+        occurrences = {n: self._occurrences(n) for n in {name, *others}}
+        return self._by_proximity(name, occurrences)
+
+    def fill(self, datasets: dict[str, list], missing=("", "N/A", "null", None)) -> int:
+        """就地为缺 URL 的条目填上文中找到的链接，返回填上的条数。"""
+        if not self.mentions:
+            return 0
+        occurrences = None
+        filled = 0
+        for name, info in datasets.items():
+            if len(info) < 2 or info[1] not in missing:
+                continue
+            url = self._by_similarity(name)
+            if not url:
+                if occurrences is None:
+                    occurrences = {n: self._occurrences(n) for n in datasets}
+                url = self._by_proximity(name, occurrences)
+            if url:
+                info[1] = url
+                filled += 1
+        return filled